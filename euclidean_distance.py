@@ -11,13 +11,15 @@
 #   batched_pairwise_euclidean_distance()
 #   batched_pairwise_euclidean_distance_generator()
 
+import contextlib
+
 import numpy as np
 from math import ceil
-from sklearn.metrics.pairwise import euclidean_distances
-
 
-r = np.random.uniform(size=[5, 3])
-r2 = np.random.uniform(size=[10, 3])
+try:
+    from instrumentation import count, timer
+except ImportError:
+    count = timer = lambda *args, **labels: contextlib.nullcontext()
 
 
 def row_norm(X):
@@ -71,8 +73,10 @@ def batched_pairwise_euclidean_distance(X, Y=None, batch_size=None):
         s = i * batch_size
         e = (i + 1) * batch_size
 
-        pairwise_euclidean_distance(X[s:e], Y, out=d[s:e, :])
+        with timer("euclidean_distance", stage="compute"):
+            pairwise_euclidean_distance(X[s:e], Y, out=d[s:e, :])
 
+    count("euclidean_distance_pairs", X.shape[0] * Y.shape[0])
     return d
 
 
@@ -91,16 +95,25 @@ def batched_pairwise_euclidean_distance_generator(X, Y=None, batch_size=None):
         s = i * batch_size
         e = (i + 1) * batch_size
 
-        yield pairwise_euclidean_distance(X[s:e], Y)[0]
+        with timer("euclidean_distance", stage="compute"):
+            d = pairwise_euclidean_distance(X[s:e], Y)[0]
+        count("euclidean_distance_pairs", d.size)
+        yield d
+
+
+if __name__ == "__main__":
+    from sklearn.metrics.pairwise import euclidean_distances
 
+    r = np.random.uniform(size=[5, 3])
+    r2 = np.random.uniform(size=[10, 3])
 
-sklearn = euclidean_distances(r, r2)
+    sklearn = euclidean_distances(r, r2)
 
-b1 = batched_pairwise_euclidean_distance(r, r2, r.shape[0])
+    b1 = batched_pairwise_euclidean_distance(r, r2, r.shape[0])
 
-print(np.isclose(b1, sklearn).all())
+    print(np.isclose(b1, sklearn).all())
 
-gen = batched_pairwise_euclidean_distance_generator(r, r2, r.shape[0] // 2)
-b2 = np.vstack([d for d in gen])
+    gen = batched_pairwise_euclidean_distance_generator(r, r2, r.shape[0] // 2)
+    b2 = np.vstack([d for d in gen])
 
-print(np.isclose(b2, sklearn).all())
+    print(np.isclose(b2, sklearn).all())
@@ -0,0 +1,125 @@
+# Requires
+# Python 3.7+
+#
+# Description:
+# Measures how long importing every script of this repository takes, using
+# `python -X importtime`. Each script is loaded by its path in a fresh
+# interpreter without running its `if __name__ == "__main__":` block, and the
+# heaviest modules it imports are listed. Heavy dependencies (tensorflow,
+# pyplot, sklearn, numba, ...) should only show up for scripts that cannot work
+# without them.
+#
+# Example:
+# ```
+# python importtime.py
+# python importtime.py merge_images_on_grid.py numba.py -top 5
+# ```
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+from typing import List, NamedTuple, Optional, Tuple
+
+_MARKER = "--- importtime start ---"
+
+# Runs with the directory of the script on `sys.path`, like `python <script>`.
+_LOAD_SCRIPT = """
+import importlib.util, sys, time
+path = sys.argv[1]
+sys.path.insert(0, sys.argv[2])
+print({marker!r}, file=sys.stderr, flush=True)
+start = time.perf_counter()
+spec = importlib.util.spec_from_file_location("_importtime_entry", path)
+module = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(module)
+print(time.perf_counter() - start)
+""".format(
+    marker=_MARKER
+)
+
+
+class ImportTime(NamedTuple):
+    """Import time of a single script."""
+
+    path: str
+    seconds: float
+    heaviest: List[Tuple[str, float]]
+    error: Optional[str] = None
+
+
+def entry_points(root):
+    """Returns all Python scripts below `root`, except this one."""
+    this = os.path.abspath(__file__)
+    paths = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = sorted(d for d in dirnames if not d.startswith("."))
+        for name in sorted(filenames):
+            path = os.path.join(dirpath, name)
+            if name.endswith(".py") and os.path.abspath(path) != this:
+                paths.append(path)
+    return paths
+
+
+def measure(path):
+    """Imports `path` in a new interpreter and parses `-X importtime` output.
+
+    Returns:
+        ImportTime: Wall time of loading the script and the cumulative time of
+            the top-level modules it imported, heaviest first.
+    """
+    path = os.path.abspath(path)
+    # Running from a neutral directory keeps the repository's own `numba.py`,
+    # `tensorflow/` and `matplotlib/` from shadowing the installed packages.
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", _LOAD_SCRIPT, path, os.path.dirname(path)],
+        cwd=tempfile.gettempdir(),
+        capture_output=True,
+        text=True,
+    )
+    stderr = proc.stderr.split(_MARKER, 1)[-1]
+    heaviest = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        _, cumulative, name = line.split("|")
+        # Nested imports are indented, only count the direct ones.
+        if not name.startswith(" ") or name.startswith("  "):
+            continue
+        if cumulative.strip().isdigit():
+            heaviest.append((name.strip(), int(cumulative) / 1e6))
+    heaviest.sort(key=lambda item: item[1], reverse=True)
+
+    if proc.returncode != 0:
+        error = proc.stderr.strip().splitlines()[-1]
+        return ImportTime(path, 0.0, heaviest, error)
+    return ImportTime(path, float(proc.stdout.split()[-1]), heaviest)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Measures the import time of every script in this repository."
+    )
+    parser.add_argument(
+        "paths",
+        nargs="*",
+        help="Scripts to measure. Defaults to all scripts in this repository.",
+    )
+    parser.add_argument(
+        "-top",
+        type=int,
+        default=3,
+        help="Number of heaviest imports shown per script. Default is 3.",
+    )
+    args = parser.parse_args()
+
+    paths = args.paths or entry_points(os.path.dirname(os.path.abspath(__file__)))
+    for path in paths:
+        result = measure(path)
+        name = os.path.relpath(result.path)
+        heaviest = ", ".join(f"{m} {s:.3f}s" for m, s in result.heaviest[: args.top])
+        if result.error is not None:
+            print(f"{name}: failed: {result.error}")
+        else:
+            print(f"{name}: {result.seconds:.3f}s ({heaviest})")
@@ -0,0 +1,254 @@
+# Requires
+# Python 3.7+
+#
+# Description:
+# Timers and counters for finding out where a job spends its time.
+#   timer()
+#   timed()
+#   observe()
+#   count()
+# Metrics are identified by a name and optional labels, e.g.
+# `timer("merge_images", stage="decode")`. Everything is disabled by default,
+# in which case `timer()` returns a shared no-op context manager and `count()`
+# returns immediately. Enable recording with `enable()` or by setting the
+# environment variable INSTRUMENTATION=1.
+# The recorded metrics can be exported as JSON lines or in the Prometheus text
+# format:
+#   write_json_lines()
+#   prometheus_text()
+#   dump()
+# If INSTRUMENTATION_OUTPUT is set, the metrics are dumped to that file when
+# the interpreter exits. Files ending in .prom are written in the
+# Prometheus format, all others as JSON lines.
+#
+# The other scripts in this repository use this module if it can be imported
+# and fall back to no-ops otherwise, so they can still be copied on their own:
+# ```
+# try:
+#     from instrumentation import count, timer
+# except ImportError:
+#     count = timer = lambda *args, **labels: contextlib.nullcontext()
+# ```
+# Metrics are recorded per process: work done in worker processes is recorded
+# by the parent from the results it receives.
+#
+# Example:
+# ```
+# INSTRUMENTATION=1 INSTRUMENTATION_OUTPUT=metrics.prom python rename.py . "a" "b"
+# ```
+
+import atexit
+import functools
+import json
+import os
+import re
+import threading
+import time
+
+_enabled = os.environ.get("INSTRUMENTATION", "") not in ("", "0")
+_lock = threading.Lock()
+# (name, labels) -> value
+_counters = {}
+# (name, labels) -> [count, sum, max]
+_timers = {}
+
+
+def enable():
+    """Starts recording metrics."""
+    global _enabled
+    _enabled = True
+
+
+def disable():
+    """Stops recording metrics. Already recorded metrics are kept."""
+    global _enabled
+    _enabled = False
+
+
+def enabled():
+    """Returns whether metrics are recorded."""
+    return _enabled
+
+
+def reset():
+    """Deletes all recorded metrics."""
+    with _lock:
+        _counters.clear()
+        _timers.clear()
+
+
+def count(name, value=1, **labels):
+    """Adds `value` to the counter `name`."""
+    if not _enabled:
+        return
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def observe(name, seconds, **labels):
+    """Records a duration measured elsewhere, e.g. in a worker process."""
+    if not _enabled:
+        return
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        stats = _timers.get(key)
+        if stats is None:
+            _timers[key] = [1, seconds, seconds]
+        else:
+            stats[0] += 1
+            stats[1] += seconds
+            if seconds > stats[2]:
+                stats[2] = seconds
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+class _Timer:
+    __slots__ = ("name", "labels", "start")
+
+    def __init__(self, name, labels):
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        observe(self.name, time.perf_counter() - self.start, **self.labels)
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+def timer(name, **labels):
+    """Returns a context manager that records the time spent in its block."""
+    if not _enabled:
+        return _NULL_TIMER
+    return _Timer(name, labels)
+
+
+def timed(name=None, **labels):
+    """Decorator that records the time spent in each call of a function.
+
+    `name` defaults to the name of the function. Whether metrics are enabled is
+    checked on every call, not when decorating.
+    """
+
+    def decorator(func):
+        metric = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            with _Timer(metric, labels):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def snapshot():
+    """Returns all recorded metrics as a list of dicts, sorted by name."""
+    with _lock:
+        counters = [
+            {"name": name, "type": "counter", "labels": dict(labels), "value": value}
+            for (name, labels), value in _counters.items()
+        ]
+        timers = [
+            {
+                "name": name,
+                "type": "timer",
+                "labels": dict(labels),
+                "count": stats[0],
+                "sum": stats[1],
+                "max": stats[2],
+            }
+            for (name, labels), stats in _timers.items()
+        ]
+    return sorted(counters + timers, key=lambda m: (m["name"], m["type"]))
+
+
+def write_json_lines(file):
+    """Writes one JSON object per metric to the text file object `file`."""
+    now = time.time()
+    for metric in snapshot():
+        file.write(json.dumps({"time": now, **metric}) + "\n")
+
+
+_LABEL_ESCAPES = str.maketrans({"\\": r"\\", '"': r"\"", "\n": r"\n"})
+
+
+def _prometheus_name(name):
+    return re.sub(r"[^a-zA-Z0-9_:]", "_", name)
+
+
+def _prometheus_labels(labels):
+    if not labels:
+        return ""
+    escaped = (
+        (_prometheus_name(k), str(v).translate(_LABEL_ESCAPES))
+        for k, v in labels.items()
+    )
+    return "{" + ",".join(f'{k}="{v}"' for k, v in escaped) + "}"
+
+
+def prometheus_text():
+    """Returns all recorded metrics in the Prometheus text exposition format.
+
+    Counters are exported as `<name>_total`, timers as a summary
+    `<name>_seconds` without quantiles and a gauge `<name>_seconds_max`.
+    """
+    lines = []
+    declared = set()
+
+    def declare(name, kind):
+        if name not in declared:
+            declared.add(name)
+            lines.append(f"# TYPE {name} {kind}")
+
+    metrics = snapshot()
+    for metric in metrics:
+        labels = _prometheus_labels(metric["labels"])
+        name = _prometheus_name(metric["name"])
+        if metric["type"] == "counter":
+            declare(f"{name}_total", "counter")
+            lines.append(f"{name}_total{labels} {metric['value']}")
+        else:
+            declare(f"{name}_seconds", "summary")
+            lines.append(f"{name}_seconds_count{labels} {metric['count']}")
+            lines.append(f"{name}_seconds_sum{labels} {metric['sum']!r}")
+    # Gauges are listed separately, as samples of a family must be grouped.
+    for metric in metrics:
+        if metric["type"] == "timer":
+            name = _prometheus_name(metric["name"])
+            declare(f"{name}_seconds_max", "gauge")
+            labels = _prometheus_labels(metric["labels"])
+            lines.append(f"{name}_seconds_max{labels} {metric['max']!r}")
+    return "\n".join(lines) + "\n" if lines else ""
+
+
+def dump(path):
+    """Writes all recorded metrics to `path`, in the Prometheus text format if
+    it ends in .prom and as JSON lines otherwise."""
+    with open(path, "w") as f:
+        if path.endswith(".prom"):
+            f.write(prometheus_text())
+        else:
+            write_json_lines(f)
+
+
+if os.environ.get("INSTRUMENTATION_OUTPUT"):
+    atexit.register(dump, os.environ["INSTRUMENTATION_OUTPUT"])
@@ -1,8 +1,226 @@
-from itertools import takewhile, repeat
+from array import array
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import contextlib
+import gzip
+from itertools import accumulate, takewhile, repeat
+import mmap
+from operator import add
+import os
+import struct
+import sys
+
+try:
+    from instrumentation import count, timer
+except ImportError:
+    count = timer = lambda *args, **labels: contextlib.nullcontext()
+
+
+CHUNK_SIZE = 1024 * 1024
+LINE_INDEX_SUFFIX = ".lineidx"
+_LINE_INDEX_HEADER = struct.Struct("<4sQQ")
+_LINE_INDEX_MAGIC = b"LIDX"
 
 
 def count_lines(filename):
     """Fastest way to count the number of lines in a text file."""
-    with open(filename, "rb") as f:
+    with timer("count_lines", stage="scan"), open(filename, "rb") as f:
         bufgen = takewhile(lambda x: x, (f.raw.read(1024 * 1024) for _ in repeat(None)))
-        return sum(buf.count(b"\n") for buf in bufgen)
+        lines = sum(buf.count(b"\n") for buf in bufgen)
+    count("count_lines_lines", lines)
+    return lines
+
+
+def _byte_ranges(size, n):
+    """Splits `size` bytes into at most `n` ranges aligned to `CHUNK_SIZE`."""
+    step = max(CHUNK_SIZE, -(-size // n // CHUNK_SIZE) * CHUNK_SIZE)
+    return [(start, min(start + step, size)) for start in range(0, size, step)]
+
+
+def _count_range(filename, start, end):
+    with open(filename, "rb") as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            return sum(
+                mm[i : min(i + CHUNK_SIZE, end)].count(b"\n")
+                for i in range(start, end, CHUNK_SIZE)
+            )
+
+
+def _read_count_range(filename, start, end):
+    buf = bytearray(CHUNK_SIZE)
+    view = memoryview(buf)
+    lines = 0
+    with open(filename, "rb", buffering=0) as f:
+        f.seek(start)
+        while start < end:
+            n = f.readinto(view[: min(CHUNK_SIZE, end - start)])
+            if not n:
+                break
+            lines += buf.count(b"\n", 0, n)
+            start += n
+    return lines
+
+
+def count_lines_parallel(filename, workers=None, use_threads=False):
+    """Counts lines by splitting the file into byte ranges that are counted by a
+    process pool, or a thread pool if `use_threads` is set.
+
+    Processes count memory-mapped ranges and parallelize the counting itself.
+    Threads read their range with `readinto` into a buffer of their own, which
+    releases the GIL while waiting for the read. This overlaps I/O, e.g. for
+    files that are not in the page cache or on network file systems, but the
+    counting still holds the GIL. Falls back to `count_lines` for files smaller
+    than two chunks.
+    """
+    size = os.path.getsize(filename)
+    workers = workers or os.cpu_count()
+    if size < 2 * CHUNK_SIZE or workers == 1:
+        return count_lines(filename)
+    starts, ends = zip(*_byte_ranges(size, workers))
+    if use_threads:
+        executor, count_range = ThreadPoolExecutor, _read_count_range
+    else:
+        executor, count_range = ProcessPoolExecutor, _count_range
+    with timer("count_lines", stage="scan_parallel"), executor(workers) as pool:
+        lines = sum(pool.map(count_range, repeat(filename), starts, ends))
+    count("count_lines_lines", lines)
+    return lines
+
+
+def _newline_offsets(filename, start, end):
+    offsets = array("Q")
+    with open(filename, "rb") as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            for i in range(start, end, CHUNK_SIZE):
+                parts = mm[i : min(i + CHUNK_SIZE, end)].split(b"\n")
+                # The offset of the k-th newline is the summed length of the
+                # first k + 1 parts plus the k newlines between them.
+                lengths = map(add, map(len, parts[:-1]), repeat(1))
+                offsets.extend(map(add, accumulate(lengths), repeat(i - 1)))
+    return offsets
+
+
+def build_line_index(filename, index_file=None, workers=1):
+    """Builds an array with the byte offset of every newline in `filename` and
+    stores it next to the file (`filename + LINE_INDEX_SUFFIX`).
+
+    The index makes seeking to line N an O(1) operation, see `read_line`, and
+    allows splitting a text file into line-aligned chunks for parallel
+    processing. With `workers > 1` byte ranges are indexed in parallel.
+    """
+    index_file = index_file or filename + LINE_INDEX_SUFFIX
+    stat = os.stat(filename)
+    if stat.st_size == 0:
+        offsets = array("Q")
+    elif workers == 1:
+        offsets = _newline_offsets(filename, 0, stat.st_size)
+    else:
+        starts, ends = zip(*_byte_ranges(stat.st_size, workers))
+        offsets = array("Q")
+        with ProcessPoolExecutor(workers) as pool:
+            for part in pool.map(_newline_offsets, repeat(filename), starts, ends):
+                offsets.extend(part)
+
+    # The index is stored little-endian. Only big-endian machines need a copy.
+    stored = offsets
+    if sys.byteorder != "little":
+        stored = array("Q", offsets)
+        stored.byteswap()
+    with open(index_file, "wb") as f:
+        f.write(
+            _LINE_INDEX_HEADER.pack(_LINE_INDEX_MAGIC, stat.st_size, stat.st_mtime_ns)
+        )
+        stored.tofile(f)
+    return offsets
+
+
+def load_line_index(filename, index_file=None):
+    """Loads the index written by `build_line_index`. Returns `None` if there is
+    no index or `filename` changed since the index was built."""
+    index_file = index_file or filename + LINE_INDEX_SUFFIX
+    stat = os.stat(filename)
+    try:
+        with open(index_file, "rb") as f:
+            header = f.read(_LINE_INDEX_HEADER.size)
+            data = f.read()
+    except FileNotFoundError:
+        return None
+    if len(header) != _LINE_INDEX_HEADER.size or _LINE_INDEX_HEADER.unpack(
+        header
+    ) != (_LINE_INDEX_MAGIC, stat.st_size, stat.st_mtime_ns):
+        return None
+    offsets = array("Q")
+    offsets.frombytes(data)
+    if sys.byteorder != "little":
+        offsets.byteswap()
+    return offsets
+
+
+def read_line(filename, n, index):
+    """Reads line `n` (0-based, without the newline) using a newline `index`."""
+    start = index[n - 1] + 1 if n > 0 else 0
+    with open(filename, "rb") as f:
+        f.seek(start)
+        if n < len(index):
+            return f.read(index[n] - start)
+        return f.read()
+
+
+def open_binary(filename, compression="auto"):
+    """Opens `filename` for binary reading, decompressing gzip or zstd files.
+
+    `compression` is one of "auto" (by file extension), "gzip", "zstd" or
+    `None`. Reading zstd files requires the `zstandard` package.
+    """
+    if compression == "auto":
+        compression = {".gz": "gzip", ".zst": "zstd"}.get(
+            os.path.splitext(filename)[1]
+        )
+    if compression is None:
+        return open(filename, "rb", buffering=0)
+    if compression == "gzip":
+        return gzip.open(filename, "rb")
+    if compression == "zstd":
+        import zstandard
+
+        # Files written by pzstd or concatenated logs consist of many frames.
+        return zstandard.ZstdDecompressor().stream_reader(
+            open(filename, "rb"), closefd=True, read_across_frames=True
+        )
+    raise ValueError(f"Unknown compression {compression!r}")
+
+
+def iter_line_chunks(filename, buffer_size=CHUNK_SIZE, compression="auto", copy=False):
+    """Yields chunks of `filename` that end on a line boundary.
+
+    The file is read into a single reusable buffer with the same raw 1 MiB
+    reads as `count_lines`. A partial line at the end of a read is carried over
+    to the next chunk, lines longer than `buffer_size` grow the buffer. Only the
+    last chunk may lack a trailing newline.
+
+    By default the chunks are `memoryview`s of the buffer that are overwritten
+    by the next iteration, so they have to be consumed (or copied) before
+    advancing the generator. Pass `copy=True` to get independent `bytes`.
+    """
+    buf = bytearray(buffer_size)
+    view = memoryview(buf)
+    filled = 0
+    with open_binary(filename, compression) as f:
+        while True:
+            n = f.readinto(view[filled:])
+            if not n:
+                break
+            filled += n
+            end = buf.rfind(b"\n", 0, filled) + 1
+            if end == 0:
+                if filled == len(buf):
+                    # A yielded view may still be alive, so the buffer is
+                    # replaced instead of resized.
+                    buf = bytearray(2 * len(buf))
+                    buf[:filled] = view[:filled]
+                    view = memoryview(buf)
+                continue
+            yield bytes(view[:end]) if copy else view[:end]
+            buf[: filled - end] = buf[end:filled]
+            filled -= end
+    if filled:
+        yield bytes(view[:filled]) if copy else view[:filled]
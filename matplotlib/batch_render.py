@@ -0,0 +1,150 @@
+# Requires
+# Python 3.6+, matplotlib
+#
+# Can be installed with:
+# pip install matplotlib
+#
+# Description:
+# Renders many figures in parallel worker processes.
+#   render_batch()
+# Every job is a plotting function that draws on the figure passed as `fig`
+# and saves it, e.g. `merge_and_plot()` from merge_images_on_grid.py. Each
+# worker creates a single Agg figure and canvas and reuses it for all of its
+# jobs. The figure is cleared after every job, so memory does not grow with the
+# number of figures, and fonts are loaded once per worker instead of once per
+# figure. The render time of every job is returned.
+#
+# Example:
+# ```
+# python batch_render.py -figures 200 -ticks 100
+# ```
+
+import concurrent.futures
+import time
+from typing import NamedTuple, Optional
+
+_figure = None
+
+
+class RenderResult(NamedTuple):
+    """Result of a single job of `render_batch()`."""
+
+    index: int
+    seconds: float
+    error: Optional[str] = None
+
+
+def _init_worker():
+    global _figure
+
+    import matplotlib
+
+    matplotlib.use("Agg")
+
+    from matplotlib import font_manager
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    # Builds or loads the font cache and resolves the default font once.
+    font_manager.findfont(font_manager.FontProperties())
+
+    _figure = Figure()
+    FigureCanvasAgg(_figure)
+
+
+def _render(index, func, args, kwargs):
+    import matplotlib
+
+    start = time.perf_counter()
+    error = None
+    try:
+        _figure.set_size_inches(matplotlib.rcParams["figure.figsize"])
+        _figure.set_dpi(matplotlib.rcParams["figure.dpi"])
+        func(*args, fig=_figure, **kwargs)
+    except Exception as exc:
+        error = repr(exc)
+    finally:
+        _figure.clear()
+    return RenderResult(index, time.perf_counter() - start, error)
+
+
+def render_batch(jobs, workers=None):
+    """Runs plotting jobs in a pool of worker processes.
+
+    Args:
+        jobs (Iterable[Tuple[Callable, tuple, dict]]): Jobs as tuples of
+            `(func, args, kwargs)`. Each job calls `func(*args, fig=fig,
+            **kwargs)`, where `fig` is an empty figure with the default size
+            and dpi. `func` has to draw on and save `fig` and must be picklable,
+            i.e. defined at module level.
+        workers (int, optional): Number of worker processes. Defaults to the
+            CPU count.
+
+    Returns:
+        List[RenderResult]: Render time and error of every job, in the order of
+            `jobs`.
+    """
+    with concurrent.futures.ProcessPoolExecutor(
+        workers, initializer=_init_worker
+    ) as executor:
+        futures = [
+            executor.submit(_render, i, func, args, kwargs)
+            for i, (func, args, kwargs) in enumerate(jobs)
+        ]
+        return [f.result() for f in futures]
+
+
+def plot_many_ticks(n_ticks, output_file, fig=None):
+    """Example job: A line plot with `n_ticks` labeled ticks that do not overlap."""
+    from fix_overlapping_xlabels import fix_overlapping_xlabels
+
+    ax = fig.subplots()
+    x = list(range(n_ticks))
+    ax.plot(x)
+    ax.set_xticks(x)
+    ax.set_xticklabels([f"label {i}" for i in x])
+    fix_overlapping_xlabels(fig)
+    fig.savefig(output_file)
+
+
+if __name__ == "__main__":
+    import argparse
+    import os
+    import tempfile
+
+    parser = argparse.ArgumentParser(
+        description="Renders example figures with render_batch() and reports throughput."
+    )
+    parser.add_argument(
+        "-figures", type=int, default=100, help="Number of figures. Default is 100."
+    )
+    parser.add_argument(
+        "-ticks", type=int, default=50, help="Ticks per figure. Default is 50."
+    )
+    parser.add_argument(
+        "-workers",
+        type=int,
+        default=None,
+        help="Number of worker processes. Defaults to the CPU count.",
+    )
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as output_dir:
+        jobs = [
+            (plot_many_ticks, (args.ticks, os.path.join(output_dir, f"{i}.png")), {})
+            for i in range(args.figures)
+        ]
+        start = time.perf_counter()
+        results = render_batch(jobs, args.workers)
+        elapsed = time.perf_counter() - start
+
+    render_times = sorted(r.seconds for r in results)
+    print(
+        f"Rendered {len(results)} figures in {elapsed:.2f}s "
+        f"({len(results) / elapsed:.1f} figures/s), median "
+        f"{render_times[len(render_times) // 2]:.3f}s, max {render_times[-1]:.3f}s "
+        f"per figure"
+    )
+    for r in results:
+        if r.error is not None:
+            print(f"Job {r.index} failed: {r.error}")
@@ -8,6 +8,12 @@
 # Automatically increases the width of a figure until no more x-labels overlap.
 # However, this will not work when using `plt.show()` but will function correctly
 # when saving the figure.
+# The required width is computed from the measured label extents instead of
+# growing the figure step by step. y-labels (height), all axes of a figure and
+# rotating labels instead of widening the figure are supported as well.
+
+import math
+from typing import Tuple
 
 import matplotlib.transforms as trans
 
@@ -21,7 +27,7 @@ def get_renderer(fig):
     Returns:
         matplotlib.backend_bases.RendererBase: A Matplotlib renderer.
     """
-    if fig._cachedRenderer:
+    if getattr(fig, "_cachedRenderer", None):
         renderer = fig._cachedRenderer
     else:
         canvas = fig.canvas
@@ -60,45 +66,173 @@ def get_figure_bbox(fig, bbox) -> Tuple[float, float, float, float]:
     return (x, y, width, height)
 
 
-def fix_overlapping_xlabels(fig, increment: float = 0.2):
-    """Increases the width of `fig` until x-axis labels no longer overlap.
+def required_scale(fig, renderer, axis: str = "x") -> float:
+    """Computes by how much the axes of `fig` must grow so that no tick labels
+    of `axis` overlap.
+
+    Tick labels keep their size when a figure is resized, while the distance
+    between ticks grows proportionally. The required scale can therefore be
+    computed from a single measurement of all labels.
 
     Args:
         fig (matplotlib.figure.Figure): A Matplotlib figure.
-        increment (float, optional): Inches by which `fig` will be incrementally
-            widened. Large values can lead to unnecessarily wide figures.
-            Defaults to 0.2.
+        renderer (matplotlib.backend_bases.RendererBase): A Matplotlib renderer.
+        axis (str, optional): "x" or "y". Defaults to "x".
+
+    Returns:
+        float: Factor by which the width ("x") or height ("y") of all axes has
+            to grow. 1.0 if no labels overlap.
     """
-    renderer = get_renderer(fig)
-    ax = fig.get_axes()[0]
-    # Render once, otherwise it will run infinitely long
-    ax.get_tightbbox(renderer)
-    xlabel = ax.get_xticklabels()
-    
-    while True:
-        previous_bbox = None
-        finished = True
-        for label in xlabel:
+    dim = 0 if axis == "x" else 1
+    scale = 1.0
+    for ax in fig.get_axes():
+        labels = ax.get_xticklabels() if axis == "x" else ax.get_yticklabels()
+        extents = []
+        for label in labels:
+            if not label.get_visible() or not label.get_text():
+                continue
+            anchor = label.get_transform().transform(label.get_position())[dim]
             bbox = label.get_window_extent(renderer)
-            bbox = get_figure_bbox(fig, bbox)
-            if previous_bbox:
-                if previous_bbox[0] + previous_bbox[2] > bbox[0]:
-                    figsize = fig.get_size_inches()
-                    fig.set_size_inches(figsize[0]+increment, figsize[1])
-                    finished = False
-                    break
-            previous_bbox = bbox
-        if finished:
+            start, end = (bbox.x0, bbox.x1) if axis == "x" else (bbox.y0, bbox.y1)
+            extents.append((anchor, start, end))
+        extents.sort()
+        for (anchor, _, end), (next_anchor, next_start, _) in zip(extents, extents[1:]):
+            distance = next_anchor - anchor
+            if distance > 0 and end > next_start:
+                scale = max(scale, (distance + end - next_start) / distance)
+    return scale
+
+
+def fix_overlapping_labels(
+    fig,
+    axis: str = "x",
+    mode: str = "resize",
+    rotation: float = 90,
+    increment: float = 0.2,
+    max_renders: int = 10,
+) -> int:
+    """Resizes `fig` or rotates its tick labels until the tick labels of `axis`
+    no longer overlap in any of its axes.
+
+    The required size is computed from the label extents with
+    `required_scale()`. As this assumes that the axes grow proportionally with
+    the figure, the result is measured again and corrected, with at most
+    `max_renders` layout passes in total.
+
+    Args:
+        fig (matplotlib.figure.Figure): A Matplotlib figure.
+        axis (str, optional): "x" to fix x-axis labels by widening `fig`, "y"
+            to fix y-axis labels by increasing its height. Defaults to "x".
+        mode (str, optional): "resize" or "rotate". "rotate" first rotates
+            overlapping x-axis labels by `rotation` degrees and only resizes
+            `fig` if they still overlap. Defaults to "resize".
+        rotation (float, optional): Rotation used by mode "rotate". Defaults
+            to 90.
+        increment (float, optional): The size of `fig` grows in multiples of
+            this many inches. Defaults to 0.2.
+        max_renders (int, optional): Maximal number of layout passes. Defaults
+            to 10.
+
+    Returns:
+        int: Number of layout passes that were needed.
+    """
+    dim = 0 if axis == "x" else 1
+    initial_size = fig.get_size_inches()[dim]
+    renders = 0
+    while renders < max_renders:
+        renderer = get_renderer(fig)
+        # Render once, so tick labels and their positions are up to date
+        for ax in fig.get_axes():
+            ax.get_tightbbox(renderer)
+        renders += 1
+
+        scale = required_scale(fig, renderer, axis)
+        if scale <= 1.0:
             break
 
+        if mode == "rotate" and axis == "x" and renders == 1:
+            for ax in fig.get_axes():
+                for label in ax.get_xticklabels():
+                    label.set_rotation(rotation)
+                    label.set_horizontalalignment("center" if rotation == 90 else "right")
+            continue
+
+        figsize = fig.get_size_inches()
+        growth = figsize[dim] * scale - initial_size
+        figsize[dim] = initial_size + math.ceil(growth / increment) * increment
+        fig.set_size_inches(figsize)
+    return renders
+
+
+def fix_overlapping_xlabels(fig, increment: float = 0.2, **kwargs) -> int:
+    """Increases the width of `fig` until x-axis labels no longer overlap.
+
+    Args:
+        fig (matplotlib.figure.Figure): A Matplotlib figure.
+        increment (float, optional): Inches by which the width of `fig` is
+            rounded up. Defaults to 0.2.
+        **kwargs: Passed on to `fix_overlapping_labels()`.
+
+    Returns:
+        int: Number of layout passes that were needed.
+    """
+    return fix_overlapping_labels(fig, "x", increment=increment, **kwargs)
+
+
+def fix_overlapping_ylabels(fig, increment: float = 0.2, **kwargs) -> int:
+    """Increases the height of `fig` until y-axis labels no longer overlap.
+
+    Args:
+        fig (matplotlib.figure.Figure): A Matplotlib figure.
+        increment (float, optional): Inches by which the height of `fig` is
+            rounded up. Defaults to 0.2.
+        **kwargs: Passed on to `fix_overlapping_labels()`.
+
+    Returns:
+        int: Number of layout passes that were needed.
+    """
+    return fix_overlapping_labels(fig, "y", increment=increment, **kwargs)
+
 
 if __name__ == "__main__":
+    import argparse
+    import time
+
     import matplotlib.pyplot as plt
 
-    fig, ax = plt.subplots()
-    x = [i for i in range(50)]
-    ax.plot(x)
-    ax.set_xticks(x)
-    ax.set_xticklabels(x)
-    fix_overlapping_xlabels(fig)
-    plt.show()
+    parser = argparse.ArgumentParser(
+        description="Times fixing overlapping x-labels of a figure with many ticks."
+    )
+    parser.add_argument(
+        "-ticks", type=int, default=50, help="Number of ticks. Default is 50."
+    )
+    parser.add_argument(
+        "-mode",
+        type=str,
+        default="resize",
+        choices=["resize", "rotate"],
+        help="Fix labels by resizing or rotating. Default is resize.",
+    )
+    parser.add_argument(
+        "-output", type=str, default=None, help="(Optional) Save the figure to this file."
+    )
+    args = parser.parse_args()
+
+    fig, axes = plt.subplots(2, 1)
+    x = [i for i in range(args.ticks)]
+    for ax in axes:
+        ax.plot(x)
+        ax.set_xticks(x)
+        ax.set_xticklabels([f"label {i}" for i in x])
+
+    start = time.perf_counter()
+    renders = fix_overlapping_xlabels(fig, mode=args.mode)
+    print(
+        f"{args.ticks} ticks: {time.perf_counter() - start:.3f}s, {renders} layout "
+        f"passes, figure size {fig.get_size_inches()}"
+    )
+
+    if args.output is not None:
+        fig.savefig(args.output)
+    else:
+        plt.show()
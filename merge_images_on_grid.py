@@ -1,5 +1,5 @@
 # Requires
-# Python 3+, Pillow, matplotlib, numpy
+# Python 3+, Pillow, (matplotlib, numpy [only for plots])
 #
 # Can be installed with:
 # pip install Pillow matplotlib numpy
@@ -19,12 +19,26 @@
 #
 # This will align the two images in two rows and resize them to 50% of their
 # initial size.
+#
+# ```
+# python merge_images_on_grid.py grid.dzi -images *.png -cols 100 -pyramid
+# ```
+#
+# This will write a Deep Zoom image pyramid (`grid.dzi` and `grid_files/`)
+# instead of a single image. The pyramid is built from horizontal bands of the
+# grid that are downsampled on the fly, so the full resolution grid is never
+# held in memory.
 
 import argparse
+import contextlib
+import math
 import os
 from PIL import Image
-import numpy as np
-import matplotlib.pyplot as plt
+
+try:
+    from instrumentation import count, timer
+except ImportError:
+    count = timer = lambda *args, **labels: contextlib.nullcontext()
 
 
 def layout_list(l, cols):
@@ -55,10 +69,24 @@ def merge_and_plot(
     ylabel=None,
     figsize=None,
     dpi=None,
+    fig=None,
 ):
+    """Merges `images` on a grid and saves it as a Matplotlib plot with ticks,
+    labels and title.
+
+    The plot is drawn on a new Agg figure that does not go through pyplot, so
+    nothing is kept alive after saving. Pass `fig` to draw on an existing,
+    empty figure instead, e.g. to reuse one figure and canvas for many plots.
+    """
+    # Only plotting needs matplotlib and numpy, `merge()` works without them.
+    import matplotlib
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+    import numpy as np
+
     if figsize is not None:
         if isinstance(figsize, (float, int)):
-            figsize = [s * figsize for s in plt.rcParams.get("figure.figsize").copy()]
+            figsize = [s * figsize for s in matplotlib.rcParams["figure.figsize"]]
 
     merged_img, row_heights, column_widths = merge(
         output_file, images, cols, resize, fill_color, save=False
@@ -69,7 +97,12 @@ def merge_and_plot(
     x_ticks = np.cumsum(column_widths) - np.array(column_widths) / 2
     y_ticks = np.cumsum(row_heights) - np.array(row_heights) / 2
 
-    fig, ax = plt.subplots(figsize=figsize)
+    if fig is None:
+        fig = Figure(figsize=figsize)
+        FigureCanvasAgg(fig)
+    elif figsize is not None:
+        fig.set_size_inches(figsize)
+    ax = fig.subplots()
     ax.imshow(merged_img.rotate(180).transpose(Image.FLIP_LEFT_RIGHT), origin="lower")
     ax.set_title(title)
     ax.set_xticks(x_ticks)
@@ -82,60 +115,284 @@ def merge_and_plot(
     fig.savefig(output_file, dpi=dpi)
 
 
-def merge(output_file, images, cols, resize=-1, fill_color=0, save=True):
-    assert len(images) % cols == 0, 'len("-image") % "-cols" != 0'
+def _thumbnail_box(size, resize):
+    width = size[0] * resize
+    height = size[0] * resize
+    return width, height
 
-    images = list(map(load_image_if_exists, images))
 
+def _thumbnail_size(size, box):
+    """Computes the size `Image.thumbnail(box)` resizes an image of `size` to."""
+    width, height = size
+    x, y = map(math.floor, box)
+    if x >= width and y >= height:
+        return size
+
+    def round_aspect(number, key):
+        return max(min(math.floor(number), math.ceil(number), key=key), 1)
+
+    aspect = width / height
+    if x / y >= aspect:
+        x = round_aspect(y * aspect, key=lambda n: abs(aspect - n / y))
+    else:
+        y = round_aspect(x / aspect, key=lambda n: 0 if n == 0 else abs(aspect - x / n))
+    return x, y
+
+
+def image_size(path, resize=-1):
+    """Returns the size of the image at `path` after resizing, or `None` if it
+    does not exist. Only the header of the file is read."""
+    img = load_image_if_exists(path)
+    if img is None:
+        return None
+    with img:
+        size = img.size
     if resize > 0:
-        for img in images:
-            if img is None:
-                continue
-            width = img.width * resize
-            height = img.width * resize
-            img.thumbnail((width, height), Image.LANCZOS)
+        size = _thumbnail_size(size, _thumbnail_box(size, resize))
+    return size
+
 
-    images = layout_list(images, cols)
+def load_image(path, resize=-1):
+    """Loads and resizes the image at `path`, or returns `None` if it does not
+    exist. The image is decoded right away, which closes the file."""
+    img = load_image_if_exists(path)
+    if img is None:
+        return None
+    if resize > 0:
+        img.thumbnail(_thumbnail_box(img.size, resize), Image.LANCZOS)
+    img.load()
+    return img
+
+
+def layout(images, cols, resize=-1):
+    """Computes the grid layout of `images` from their sizes.
+
+    Only the image headers are read and every file is closed again, so the
+    number of images is not limited by the number of open files.
+
+    Returns:
+        Tuple[List[List[Tuple[int, int]]], List[int], List[int]]: The size of
+            every image in grid rows (`None` for missing images), the row
+            heights and the column widths.
+    """
+    assert len(images) % cols == 0, 'len("-image") % "-cols" != 0'
+
+    sizes = layout_list([image_size(path, resize) for path in images], cols)
 
     column_widths = [0] * cols
-    for row in images:
-        for i, img in enumerate(row):
-            width = img.width if img is not None else 0
+    for row in sizes:
+        for i, size in enumerate(row):
+            width = size[0] if size is not None else 0
             column_widths[i] = max(column_widths[i], width)
 
-    row_heights = [0] * len(images)
-    for i, row in enumerate(images):
-        for img in row:
-            height = img.height if img is not None else 0
+    row_heights = [0] * len(sizes)
+    for i, row in enumerate(sizes):
+        for size in row:
+            height = size[1] if size is not None else 0
             row_heights[i] = max(row_heights[i], height)
 
+    return sizes, row_heights, column_widths
+
+
+def merge(output_file, images, cols, resize=-1, fill_color=0, save=True):
+    # "layout" only reads the image headers, images are decoded in "paste".
+    with timer("merge_images", stage="layout"):
+        sizes, row_heights, column_widths = layout(images, cols, resize)
+    count("merge_images_images", sum(s is not None for row in sizes for s in row))
+    paths = layout_list(images, cols)
+
     total_width = sum(column_widths)
     total_height = sum(row_heights)
-    merged_img = Image.new("RGB", (total_width, total_height), color=fill_color)
+    with timer("merge_images", stage="paste"):
+        merged_img = Image.new("RGB", (total_width, total_height), color=fill_color)
 
-    x_offset = 0
-    y_offset = 0
-    for row_id, row in enumerate(images):
         x_offset = 0
-        row_height = row_heights[row_id]
-        for col_id, img in enumerate(row):
-            column_width = column_widths[col_id]
-            if img is None:
+        y_offset = 0
+        for row_id, row in enumerate(paths):
+            x_offset = 0
+            row_height = row_heights[row_id]
+            for col_id, path in enumerate(row):
+                column_width = column_widths[col_id]
+                if sizes[row_id][col_id] is None:
+                    x_offset += column_width
+                    continue
+                with load_image(path, resize) as img:
+                    assert img.size == sizes[row_id][col_id], (
+                        f"{path}: loaded size {img.size} differs from the "
+                        f"layout size {sizes[row_id][col_id]}"
+                    )
+                    width, height = img.size
+                    x = x_offset + (column_width // 2) - (width // 2)
+                    y = y_offset + (row_height // 2) - (height // 2)
+                    merged_img.paste(img, (x, y))
                 x_offset += column_width
-                continue
-            width, height = img.size
-            x = x_offset + (column_width // 2) - (width // 2)
-            y = y_offset + (row_height // 2) - (height // 2)
-            merged_img.paste(img, (x, y))
-            x_offset += column_width
-        y_offset += row_height
+            y_offset += row_height
 
     if save:
-        merged_img.save(output_file)
+        with timer("merge_images", stage="write"):
+            merged_img.save(output_file)
 
     return merged_img, row_heights, column_widths
 
 
+class PyramidLevel:
+    """Writes the tiles of one level of a Deep Zoom image pyramid.
+
+    Horizontal bands of the level are collected with `push()` until a full row
+    of tiles is available. The row is then written to disk, downsampled by a
+    factor of 2 and pushed to the next lower level.
+    """
+
+    def __init__(
+        self, tiles_dir, level, width, height, tile_size, tile_format, fill_color
+    ):
+        self.tiles_dir = os.path.join(tiles_dir, str(level))
+        self.width = width
+        self.height = height
+        self.tile_size = tile_size
+        self.tile_format = tile_format
+        self.fill_color = fill_color
+        self.next_level = None
+        self.row = 0
+        self.buffer = None
+        self.filled = 0
+        os.makedirs(self.tiles_dir, exist_ok=True)
+
+    def push(self, band):
+        if self.buffer is None:
+            buffer_height = min(self.tile_size, self.height - self.row * self.tile_size)
+            self.buffer = Image.new(
+                "RGB", (self.width, buffer_height), color=self.fill_color
+            )
+        self.buffer.paste(band, (0, self.filled))
+        self.filled += band.height
+        if self.filled >= self.buffer.height:
+            self.write_row()
+
+    def write_row(self):
+        for col, x in enumerate(range(0, self.width, self.tile_size)):
+            right = min(x + self.tile_size, self.width)
+            tile = self.buffer.crop((x, 0, right, self.buffer.height))
+            tile.save(
+                os.path.join(self.tiles_dir, f"{col}_{self.row}.{self.tile_format}")
+            )
+        if self.next_level is not None:
+            self.next_level.push(self.buffer.reduce(2))
+        self.row += 1
+        self.buffer = None
+        self.filled = 0
+
+
+def merge_to_pyramid(
+    output_file,
+    images,
+    cols,
+    resize=-1,
+    fill_color=0,
+    tile_size=256,
+    tile_format="png",
+):
+    """Writes the merged grid as a Deep Zoom image pyramid.
+
+    The grid is composed in bands of `tile_size` rows. Every band is cut into
+    tiles and downsampled to feed the next lower level, so only one band per
+    level is in memory at a time. Images are loaded one grid row at a time,
+    when the first band reaches the row, and closed as soon as the bands have
+    passed it.
+
+    Args:
+        output_file (str): Path of the `.dzi` file. Tiles are written to
+            `<output_file without extension>_files/<level>/<col>_<row>.<ext>`.
+        images (List[str]): Image files, laid out left to right, top to bottom.
+        cols (int): Number of columns of the grid.
+        resize (float, optional): Ratio to resize images by. Defaults to -1,
+            which keeps the original size.
+        fill_color (int or Tuple[int, int, int], optional): Background color.
+            Defaults to 0.
+        tile_size (int, optional): Edge length of the tiles in pixels. Must be
+            even. Defaults to 256.
+        tile_format (str, optional): File extension of the tiles. Defaults to
+            "png".
+
+    Returns:
+        Tuple[int, int]: Width and height of the full resolution grid.
+    """
+    assert tile_size % 2 == 0, "tile_size must be even"
+
+    sizes, row_heights, column_widths = layout(images, cols, resize)
+    paths = layout_list(images, cols)
+    total_width = sum(column_widths)
+    total_height = sum(row_heights)
+
+    tiles_dir = os.path.splitext(output_file)[0] + "_files"
+    max_level = math.ceil(math.log2(max(total_width, total_height, 1)))
+    levels = []
+    for level in range(max_level, -1, -1):
+        factor = 2 ** (max_level - level)
+        levels.append(
+            PyramidLevel(
+                tiles_dir,
+                level,
+                -(-total_width // factor),
+                -(-total_height // factor),
+                tile_size,
+                tile_format,
+                fill_color,
+            )
+        )
+    for level, next_level in zip(levels, levels[1:]):
+        level.next_level = next_level
+
+    column_offsets = [sum(column_widths[:i]) for i in range(cols)]
+    row_offsets = [sum(row_heights[:i]) for i in range(len(row_heights))]
+
+    # Grid row -> its loaded images.
+    loaded = {}
+    first_row = 0
+    for band_y in range(0, total_height, tile_size):
+        band_height = min(tile_size, total_height - band_y)
+        band = Image.new("RGB", (total_width, band_height), color=fill_color)
+        for row_id in range(first_row, len(paths)):
+            row_y = row_offsets[row_id]
+            row_height = row_heights[row_id]
+            if row_y >= band_y + band_height:
+                break
+            if row_id not in loaded:
+                loaded[row_id] = []
+                for path, size in zip(paths[row_id], sizes[row_id]):
+                    img = load_image(path, resize) if size is not None else None
+                    assert img is None or img.size == size, (
+                        f"{path}: loaded size {img.size} differs from the "
+                        f"layout size {size}"
+                    )
+                    loaded[row_id].append(img)
+            for col_id, img in enumerate(loaded[row_id]):
+                if img is None:
+                    continue
+                width, height = img.size
+                x = column_offsets[col_id] + (column_widths[col_id] // 2) - (width // 2)
+                y = row_y + (row_height // 2) - (height // 2)
+                if y < band_y + band_height and y + height > band_y:
+                    band.paste(img, (x, y - band_y))
+            if row_y + row_height <= band_y + band_height:
+                for img in loaded.pop(row_id):
+                    if img is not None:
+                        img.close()
+                first_row = row_id + 1
+        levels[0].push(band)
+
+    with open(os.path.splitext(output_file)[0] + ".dzi", "w") as f:
+        f.write(
+            '<?xml version="1.0" encoding="UTF-8"?>\n'
+            '<Image xmlns="http://schemas.microsoft.com/deepzoom/2008" '
+            f'Format="{tile_format}" Overlap="0" TileSize="{tile_size}">'
+            f'<Size Width="{total_width}" Height="{total_height}"/>'
+            "</Image>\n"
+        )
+
+    return total_width, total_height
+
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
 
@@ -165,7 +422,7 @@ if __name__ == "__main__":
         "-fill_color",
         type=int,
         default=0,
-        nargs="3",
+        nargs=3,
         help="Default color to use for filling. Requires 3 values as RGB. Default is black.",
     )
 
@@ -214,10 +471,41 @@ if __name__ == "__main__":
         default=None,
         help="(Optional) dpi of plot. If set, will output a matplotlib plot instead of a plain image.",
     )
+    parser.add_argument(
+        "-pyramid",
+        action="store_true",
+        help="Write a Deep Zoom image pyramid to `output_file` (.dzi) instead of a single image.",
+    )
+    parser.add_argument(
+        "-tile_size",
+        type=int,
+        default=256,
+        help="Edge length of pyramid tiles in pixels. Default is 256.",
+    )
+    parser.add_argument(
+        "-tile_format",
+        type=str,
+        default="png",
+        help="File format of pyramid tiles. Default is png.",
+    )
 
     args = parser.parse_args()
 
-    if (
+    fill_color = args.fill_color
+    if isinstance(fill_color, list):
+        fill_color = tuple(fill_color)
+
+    if args.pyramid:
+        merge_to_pyramid(
+            args.output_file,
+            args.images,
+            args.cols,
+            args.resize,
+            fill_color,
+            tile_size=args.tile_size,
+            tile_format=args.tile_format,
+        )
+    elif (
         args.title is not None
         or args.x_ticklabels is not None
         or args.y_ticklabels is not None
@@ -234,7 +522,7 @@ if __name__ == "__main__":
             args.images,
             args.cols,
             args.resize,
-            args.fill_color,
+            fill_color,
             title=args.title,
             x_ticklabels=args.x_ticklabels,
             y_ticklabels=args.y_ticklabels,
@@ -244,5 +532,5 @@ if __name__ == "__main__":
             dpi=args.dpi,
         )
     else:
-        merge(args.output_file, args.images, args.cols, args.resize, args.fill_color)
+        merge(args.output_file, args.images, args.cols, args.resize, fill_color)
 
@@ -9,12 +9,98 @@
 #
 # Note:Be careful not to use parallelized functions within functions that
 #      already have @numba.njit(parallel=True)!
+#
+# numba is only imported, and each function only turned into a numba
+# dispatcher, when the function is first accessed as an attribute of this
+# module, including by `from ... import parallel_argsort`. Importing the file
+# itself is cheap. The accessed attribute is the real dispatcher, so it can be
+# called with keyword arguments and from other jitted functions.
+#
+# If instrumentation.py can be imported, creating a dispatcher is recorded as
+# the metric `numba_kernel` with stage="load". Calls are only timed through
+# the opt-in wrapper returned by `timed_kernel()`.
+
+import contextlib
+import functools
+import time
 
 import numpy as np
-import numba
 
+try:
+    from instrumentation import observe, timer
+except ImportError:
+    observe = timer = lambda *args, **labels: contextlib.nullcontext()
+
+# Name -> (function, options) of the functions that are compiled on access.
+_KERNELS = {}
+
+
+def lazy_njit(**options):
+    """Registers `func` to be compiled with `numba.njit(**options)` when it is
+    first accessed as an attribute of this module.
+
+    The decorated name is removed from the module at the end of this file, so
+    that the access goes through `__getattr__`.
+    """
+
+    def decorator(func):
+        _KERNELS[func.__name__] = (func, options)
+        return func
+
+    return decorator
+
+
+def __getattr__(name):
+    if name not in _KERNELS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    # Binds the module global `numba` that the function bodies refer to, e.g.
+    # for `numba.prange`, before numba resolves them while compiling.
+    global numba
+    import numba
+
+    func, options = _KERNELS[name]
+    with timer("numba_kernel", kernel=name, stage="load"):
+        # Without signatures, njit compiles on the first call per signature.
+        dispatcher = globals()[name] = numba.njit(**options)(func)
+    return dispatcher
 
-@numba.njit(parallel=True)
+
+def timed_kernel(name):
+    """Returns a wrapper of the kernel `name` that records the time of each
+    call as the metric `numba_kernel`.
+
+    Calls that compile the kernel for new argument types are recorded with
+    stage="compile", which includes running it, all others with
+    stage="call". The wrapper is a Python function, so it cannot be called
+    from jitted code. Use the kernel itself there.
+
+    Args:
+        name (str): Name of a kernel in this module, e.g. "parallel_argsort".
+
+    Returns:
+        Callable: Wrapper with the same arguments as the kernel.
+    """
+    dispatcher = globals()[name] if name in globals() else __getattr__(name)
+
+    @functools.wraps(dispatcher.py_func)
+    def wrapper(*args, **kwargs):
+        n_signatures = len(dispatcher.signatures)
+        start = time.perf_counter()
+        result = dispatcher(*args, **kwargs)
+        seconds = time.perf_counter() - start
+        compiled = len(dispatcher.signatures) > n_signatures
+        stage = "compile" if compiled else "call"
+        observe("numba_kernel", seconds, kernel=name, stage=stage)
+        return result
+
+    return wrapper
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_KERNELS))
+
+
+@lazy_njit(parallel=True)
 def parallel_searchsorted(a, v):
     indices = np.empty(v.shape, dtype=np.int64)
     for i in numba.prange(v.shape[0]):
@@ -22,7 +108,7 @@ def parallel_searchsorted(a, v):
     return indices
 
 
-@numba.njit(parallel=True)
+@lazy_njit(parallel=True)
 def parallel_searchsorted_left(a, v):
     indices = np.empty(v.shape, dtype=np.int64)
     for i in numba.prange(v.shape[0]):
@@ -30,7 +116,7 @@ def parallel_searchsorted_left(a, v):
     return indices
 
 
-@numba.njit(parallel=True)
+@lazy_njit(parallel=True)
 def parallel_searchsorted_right(a, v):
     indices = np.empty(v.shape, dtype=np.int64)
     for i in numba.prange(v.shape[0]):
@@ -38,7 +124,7 @@ def parallel_searchsorted_right(a, v):
     return indices
 
 
-@numba.njit(parallel=True)
+@lazy_njit(parallel=True)
 def parallel_knn_indices(X, n_neighbors):
     knn_indices = np.empty((X.shape[0], n_neighbors), dtype=np.int64)
     for i in numba.prange(knn_indices.shape[0]):
@@ -46,7 +132,7 @@ def parallel_knn_indices(X, n_neighbors):
     return knn_indices
 
 
-@numba.njit(parallel=True)
+@lazy_njit(parallel=True)
 def parallel_knn_indices_quicksort(X, n_neighbors):
     knn_indices = np.empty((X.shape[0], n_neighbors), dtype=np.int64)
     for i in numba.prange(knn_indices.shape[0]):
@@ -54,7 +140,7 @@ def parallel_knn_indices_quicksort(X, n_neighbors):
     return knn_indices
 
 
-@numba.njit(parallel=True)
+@lazy_njit(parallel=True)
 def parallel_knn_indices_mergesort(X, n_neighbors):
     knn_indices = np.empty((X.shape[0], n_neighbors), dtype=np.int64)
     for i in numba.prange(knn_indices.shape[0]):
@@ -62,7 +148,7 @@ def parallel_knn_indices_mergesort(X, n_neighbors):
     return knn_indices
 
 
-@numba.njit(parallel=True)
+@lazy_njit(parallel=True)
 def parallel_argsort(X):
     index_array = np.empty(X.shape, dtype=np.int64)
     for i in numba.prange(index_array.shape[0]):
@@ -70,7 +156,7 @@ def parallel_argsort(X):
     return index_array
 
 
-@numba.njit(parallel=True)
+@lazy_njit(parallel=True)
 def parallel_argsort_quicksort(X):
     index_array = np.empty(X.shape, dtype=np.int64)
     for i in numba.prange(index_array.shape[0]):
@@ -78,7 +164,7 @@ def parallel_argsort_quicksort(X):
     return index_array
 
 
-@numba.njit(parallel=True)
+@lazy_njit(parallel=True)
 def parallel_argsort_mergesort(X):
     index_array = np.empty(X.shape, dtype=np.int64)
     for i in numba.prange(index_array.shape[0]):
@@ -86,7 +172,7 @@ def parallel_argsort_mergesort(X):
     return index_array
 
 
-@numba.njit(parallel=True)
+@lazy_njit(parallel=True)
 def parallel_sort_by_argsort(X, argsort_indices):
     sorted_array = np.empty(X.shape, dtype=X.dtype)
     for i in numba.prange(sorted_array.shape[0]):
@@ -94,7 +180,7 @@ def parallel_sort_by_argsort(X, argsort_indices):
     return sorted_array
 
 
-@numba.njit(parallel=True)
+@lazy_njit(parallel=True)
 def parallel_take_along_axis(X, indices):
     """Takes indices along axis=-1 from X. Only works on 2-D arrays.
 
@@ -111,7 +197,7 @@ def parallel_take_along_axis(X, indices):
     return taken
 
 
-@numba.njit(parallel=True)
+@lazy_njit(parallel=True)
 def parallel_put_by_advanced_index(X, advanced_indices, values):
     """Takes a 2-tuple advanced index (x,y) and a 1-D array of values and puts
     these into the appropriate positions.
@@ -124,7 +210,7 @@ def parallel_put_by_advanced_index(X, advanced_indices, values):
     return X
 
 
-@numba.njit(parallel=True)
+@lazy_njit(parallel=True)
 def parallel_put_by_advanced_index_scalar(X, advanced_indices, value):
     """Takes a 2-tuple advanced index (x,y) and a scalar value and puts
     it into the appropriate positions.
@@ -137,7 +223,7 @@ def parallel_put_by_advanced_index_scalar(X, advanced_indices, value):
     return X
 
 
-@numba.njit(parallel=True)
+@lazy_njit(parallel=True)
 def parallel_insert(X, indices, value):
     """Insert `value` at all `indices` into X. This will shift all elements 
     starting at `indice` to the right. Elements whose index is > X.shape[1] will
@@ -161,7 +247,7 @@ def parallel_insert(X, indices, value):
     return new
 
 
-@numba.njit(parallel=True)
+@lazy_njit(parallel=True)
 def parallel_knn_indices(X, n_neighbors):
     """This handles the case of multiple farthest neighbors that all have an
     equal distance to the center."""
@@ -184,7 +270,7 @@ def parallel_knn_indices(X, n_neighbors):
     knn_indices = knn_indices[:, :max_knn_index].copy()
     return knn_indices, mask
 
-@numba.njit(parallel=True)
+@lazy_njit(parallel=True)
 def parallel_take_by_advanced_index(X, advanced_indices):
     """Allows using a 2-D advanced index, e.g. result from np.where() to pick
     elements from a 2- D array X.
@@ -195,4 +281,9 @@ def parallel_take_by_advanced_index(X, advanced_indices):
         x = x_indices[i]
         y = y_indices[i]
         new_array[i] = X[x, y]
-    return new_array
\ No newline at end of file
+    return new_array
+
+
+for _name in _KERNELS:
+    del globals()[_name]
+del _name
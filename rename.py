@@ -11,13 +11,453 @@
 # ```
 # This will check all files in `./` that include ".test_012" and will replace
 # that string with ".test".
+#
+# All renames are planned before anything is touched. Two files renamed to the
+# same name or a rename that overwrites an existing file abort the run. Swaps
+# and chains like a -> b, b -> c are resolved through temporary names, and the
+# renames themselves run in a thread pool.
+#
+# ```
+# python rename.py ./ ".test_012" ".test" -r -journal rename.journal
+# python rename.py -resume rename.journal
+# python rename.py -undo rename.journal
+# ```
+# With a journal, the plan and every completed rename are recorded, so an
+# interrupted run can be resumed and a finished one can be reverted.
 
 import argparse
 import concurrent.futures
-import multiprocessing
-import pathlib
+import contextlib
+import json
+import os
 from pathlib import Path
 import re
+import sys
+import time
+from typing import NamedTuple
+import uuid
+
+try:
+    from instrumentation import count, observe, timer
+except ImportError:
+    count = observe = timer = lambda *args, **labels: contextlib.nullcontext()
+
+
+class RenameError(ValueError):
+    pass
+
+
+class RenameOp(NamedTuple):
+    source: str
+    target: str
+
+
+def _split(path):
+    # Much faster than `os.path.split` for the millions of paths of a large tree.
+    head, sep, tail = path.rpartition(os.sep)
+    return head or sep, tail
+
+
+def _join(head, tail):
+    if not head:
+        return tail
+    return head + tail if head.endswith(os.sep) else head + os.sep + tail
+
+
+def compile_replacement(pattern, replace):
+    """Compiles `replace` into a function that expands it for a match.
+
+    `:<name>` and `:<number>` in `replace` are resolved against the groups of
+    `pattern` once, instead of once per match. References to groups that do
+    not exist are kept as they are.
+    """
+    parts = []
+    position = 0
+    for ref in re.finditer(":<(.*?)>", replace):
+        group = ref.group(1)
+        if group in pattern.groupindex:
+            key = group
+        elif group.isdigit() and int(group) <= pattern.groups:
+            key = int(group)
+        else:
+            continue
+        parts.append(replace[position : ref.start()])
+        parts.append(key)
+        position = ref.end()
+    parts.append(replace[position:])
+
+    literals = parts[::2]
+    keys = parts[1::2]
+
+    def expand(match):
+        values = [match.group(k) or "" for k in keys]
+        return "".join(
+            [literal + value for literal, value in zip(literals, values)]
+            + [literals[-1]]
+        )
+
+    return expand
+
+
+def scan(inpath, recursive=False, exclude=None):
+    """Yields the paths of all entries below `inpath` using `os.scandir`.
+
+    Paths are formatted like `str(Path(inpath) / name)`. Directories whose name
+    matches the compiled regex `exclude` are not descended into.
+    """
+    root = str(Path(inpath))
+    stack = [root]
+    while stack:
+        directory = stack.pop()
+        with os.scandir(directory) as it:
+            for entry in it:
+                path = entry.name if directory == "." else entry.path
+                yield path
+                if (
+                    recursive
+                    and entry.is_dir(follow_symlinks=False)
+                    and (exclude is None or not exclude.search(entry.name))
+                ):
+                    stack.append(path)
+
+
+def plan_renames(paths, pattern, replace):
+    """Computes the renames for `paths` and checks them for collisions.
+
+    `paths` must contain all entries of the directories the renamed entries are
+    in, as yielded by `scan()`.
+
+    The target of a path is computed like the `rename` utility does, by
+    replacing the text matched by `pattern` in the whole path. Every rename
+    must keep the entry in its (possibly renamed) parent directory.
+
+    Raises:
+        RenameError: If two entries would be renamed to the same path, if an
+            existing entry would be overwritten or if an entry would be moved to
+            another directory.
+
+    Returns:
+        List[RenameOp]: The renames, with targets as full final paths.
+    """
+    # `scan()` is lazy, so this is where the directories are walked.
+    with timer("rename", stage="scan"):
+        paths = list(paths)
+    count("rename_scanned", len(paths))
+    start = time.perf_counter()
+    existing = set(paths)
+    expand = compile_replacement(pattern, replace)
+    targets = {}
+    for path in paths:
+        match = pattern.search(path)
+        if match:
+            targets[path] = path.replace(match.group(0), expand(match))
+
+    final_dirs = {}
+
+    def final_dir(directory):
+        if directory in targets:
+            return targets[directory]
+        if directory not in final_dirs:
+            parent, name = _split(directory)
+            final_dirs[directory] = (
+                _join(final_dir(parent), name)
+                if parent and parent != directory
+                else directory
+            )
+        return final_dirs[directory]
+
+    ops = []
+    local_targets = []
+    seen = {}
+    for source, target in targets.items():
+        source_dir, source_name = _split(source)
+        target_dir, target_name = _split(target)
+        if target_dir != final_dir(source_dir):
+            raise RenameError(f"Rename({source}, {target}) moves to another directory")
+        if target_name == source_name:
+            continue
+        if target in seen:
+            raise RenameError(
+                f"Rename({seen[target]}, {target}) and Rename({source}, {target}) collide"
+            )
+        seen[target] = source
+        ops.append(RenameOp(source, target))
+        local_targets.append(_join(source_dir, target_name))
+
+    # Every target lies in a scanned directory, so `existing` holds all entries
+    # a rename could overwrite. Entries that are renamed themselves make room.
+    sources = {op.source for op in ops}
+    for (source, target), local_target in zip(ops, local_targets):
+        if local_target not in sources and local_target in existing:
+            raise RenameError(f"Rename({source}, {target}) overwrites {local_target}")
+    observe("rename", time.perf_counter() - start, stage="plan")
+    count("rename_planned", len(ops))
+    return ops
+
+
+def schedule_renames(ops):
+    """Orders `ops` into phases of `(source, destination)` renames.
+
+    Entries are renamed within their current directory, deepest entries first,
+    so children are renamed before their parent directory moves. Renames within
+    a phase are independent and can run in parallel. Sources that are the
+    target of another rename (chains and cycles) are first moved to a temporary
+    name in an earlier phase.
+
+    Returns:
+        List[List[Tuple[str, str]]]: The phases in execution order.
+    """
+    start = time.perf_counter()
+    by_depth = {}
+    for op in ops:
+        by_depth.setdefault(op.source.count(os.sep), []).append(op)
+
+    token = uuid.uuid4().hex[:8]
+    phases = []
+    for depth in sorted(by_depth, reverse=True):
+        renames = [
+            (op.source, _join(_split(op.source)[0], _split(op.target)[1]))
+            for op in by_depth[depth]
+        ]
+        occupied = {destination for _, destination in renames}
+        vacate = []
+        move = []
+        for i, (source, destination) in enumerate(renames):
+            if source in occupied:
+                temporary = f"{source}.rename-{token}-{i}"
+                vacate.append((source, temporary))
+                move.append((temporary, destination))
+            else:
+                move.append((source, destination))
+        phases.extend(phase for phase in (vacate, move) if phase)
+    observe("rename", time.perf_counter() - start, stage="schedule")
+    return phases
+
+
+class Journal:
+    """Append-only record of a rename plan and of its progress.
+
+    The file starts with a header line and one JSON line `[phase, source,
+    destination]` per rename, with absolute paths, which are synced to disk
+    before anything is renamed. Progress is appended as `d <step>` (renamed)
+    and `u <step>` (undone) lines that are synced every `sync_every` records
+    and at the end of every phase, before the next phase starts. A crash
+    therefore loses at most unsynced records of the phase that was running.
+    `apply_renames` and `undo_renames` detect renames that happened but were
+    not recorded.
+    """
+
+    def __init__(self, path, phases, done, sync_every=1000):
+        self.path = path
+        self.phases = phases
+        self.done = done
+        self.sync_every = sync_every
+        self._unsynced = 0
+        self._file = open(path, "a")
+
+    @classmethod
+    def create(cls, path, phases, sync_every=1000):
+        # Absolute paths keep the journal usable from another directory.
+        cwd = os.getcwd()
+        phases = [
+            [
+                (
+                    s if os.path.isabs(s) else _join(cwd, s),
+                    d if os.path.isabs(d) else _join(cwd, d),
+                )
+                for s, d in phase
+            ]
+            for phase in phases
+        ]
+        with open(path, "x") as f:
+            f.write(json.dumps({"rename_journal": 1, "steps": sum(map(len, phases))}))
+            f.write("\n")
+            for phase_id, phase in enumerate(phases):
+                for source, destination in phase:
+                    f.write(json.dumps([phase_id, source, destination]) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        return cls(path, phases, [False] * sum(map(len, phases)), sync_every)
+
+    @classmethod
+    def load(cls, path, sync_every=1000):
+        with open(path, "rb") as f:
+            lines = f.read().split(b"\n")
+        # A crash can leave an incomplete last line, which is cut off.
+        partial = lines.pop()
+        if partial:
+            with open(path, "r+b") as f:
+                f.truncate(f.seek(0, os.SEEK_END) - len(partial))
+
+        header = json.loads(lines[0])
+        phases = []
+        for line in lines[1 : header["steps"] + 1]:
+            phase_id, source, destination = json.loads(line)
+            if phase_id == len(phases):
+                phases.append([])
+            phases[phase_id].append((source, destination))
+        done = [False] * header["steps"]
+        for line in lines[header["steps"] + 1 :]:
+            marker, _, step = line.partition(b" ")
+            done[int(step)] = marker == b"d"
+        return cls(path, phases, done, sync_every)
+
+    def steps(self):
+        """Returns the phases as lists of `(step, source, destination)`."""
+        step = 0
+        phases = []
+        for phase in self.phases:
+            phases.append([(step + i, s, d) for i, (s, d) in enumerate(phase)])
+            step += len(phase)
+        return phases
+
+    def record(self, marker, steps):
+        for step in steps:
+            self._file.write(f"{marker} {step}\n")
+            self.done[step] = marker == "d"
+        self._unsynced += len(steps)
+        if self._unsynced >= self.sync_every:
+            self.sync()
+
+    def sync(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._unsynced = 0
+
+    def close(self):
+        self.sync()
+        self._file.close()
+
+
+def _run_phases(phases, workers, batch_size, stage, journal=None, marker=None):
+    """Renames `(step, source, destination)` tuples phase by phase.
+
+    With a `journal`, completed steps are recorded with `marker` and the
+    journal is synced after every phase, so a phase only starts once all
+    earlier phases are on disk. A rename whose source is gone and whose
+    destination exists already counts as done, which makes interrupted runs
+    resumable.
+    """
+
+    def rename(batch):
+        done = []
+        errors = []
+        for step, source, destination in batch:
+            try:
+                os.rename(source, destination)
+            except FileNotFoundError as exc:
+                if not os.path.lexists(destination):
+                    errors.append((source, destination, exc))
+                    continue
+            except OSError as exc:
+                errors.append((source, destination, exc))
+                continue
+            done.append(step)
+        return done, errors
+
+    with concurrent.futures.ThreadPoolExecutor(workers) as executor, timer(
+        "rename", stage=stage
+    ):
+        for phase in phases:
+            batches = [phase[i : i + batch_size] for i in range(0, len(phase), batch_size)]
+            errors = []
+            for done, batch_errors in executor.map(rename, batches):
+                if journal is not None:
+                    journal.record(marker, done)
+                errors.extend(batch_errors)
+                count("rename_renames", len(done), stage=stage, status="done")
+                count("rename_renames", len(batch_errors), stage=stage, status="failed")
+            if journal is not None:
+                journal.sync()
+            if errors:
+                return errors
+    return []
+
+
+def apply_renames(phases, workers=None, batch_size=1000, journal=None):
+    """Runs the renames of each phase in a thread pool, in batches of
+    `batch_size` renames per task.
+
+    Stops after the first phase with failures, as later phases may depend on it.
+    With a `Journal`, `phases` is taken from it, renames recorded as done are
+    skipped and every completed rename is recorded, so a failed or interrupted
+    run can be resumed by calling this again with `Journal.load()`.
+
+    Returns:
+        List[Tuple[str, str, Exception]]: The failed renames.
+    """
+    if journal is None:
+        steps = [[(None, s, d) for s, d in phase] for phase in phases]
+        return _run_phases(steps, workers, batch_size, "apply")
+
+    try:
+        if any(journal.done):
+            vacated, errors = _check_vacated(journal)
+            journal.record("d", vacated)
+            if errors:
+                return errors
+        steps = [
+            [step for step in phase if not journal.done[step[0]]]
+            for phase in journal.steps()
+        ]
+        return _run_phases(steps, workers, batch_size, "apply", journal, "d")
+    finally:
+        journal.sync()
+
+
+def _check_vacated(journal):
+    """Checks the vacate steps of a resumed run that are not recorded as done.
+
+    A vacate step moves its source to a temporary name that is the source of a
+    rename in the next phase. If the temporary name exists, the step ran and
+    only its record was lost. If it does not exist but a later phase already
+    ran, the source may by now hold the file renamed to it, so the step must
+    not run again.
+
+    Returns:
+        Tuple[List[int], List[Tuple[str, str, Exception]]]: The steps that
+            turned out to be done and the steps that must not run.
+    """
+    phases = journal.steps()
+    vacated = []
+    errors = []
+    later_started = False
+    for phase_id in range(len(phases) - 2, -1, -1):
+        later_started = later_started or any(
+            journal.done[step] for step, _, _ in phases[phase_id + 1]
+        )
+        temporaries = {source for _, source, _ in phases[phase_id + 1]}
+        for step, source, destination in phases[phase_id]:
+            if journal.done[step] or destination not in temporaries:
+                continue
+            if os.path.lexists(destination):
+                vacated.append(step)
+            elif later_started:
+                errors.append(
+                    (
+                        source,
+                        destination,
+                        RenameError("a later phase already ran, not moving it again"),
+                    )
+                )
+    return vacated, errors
+
+
+def undo_renames(journal, workers=None, batch_size=1000):
+    """Reverts all renames recorded as done in `journal`, last phase first.
+
+    Returns:
+        List[Tuple[str, str, Exception]]: The renames that could not be
+            reverted.
+    """
+    steps = [
+        [(step, d, s) for step, s, d in phase if journal.done[step]]
+        for phase in reversed(journal.steps())
+    ]
+    try:
+        return _run_phases(steps, workers, batch_size, "undo", journal, "u")
+    finally:
+        journal.sync()
 
 
 if __name__ == "__main__":
@@ -27,10 +467,13 @@ if __name__ == "__main__":
             "renaming files given a python regex."
         )
     )
-    parser.add_argument("inpath", type=str, help=("Directory to search for files."))
+    parser.add_argument(
+        "inpath", type=str, nargs="?", help=("Directory to search for files.")
+    )
     parser.add_argument(
         "pattern",
         type=str,
+        nargs="?",
         help=(
             "A regex pattern used to match files. May include "
             "Named Capture Groups: (?P<name>...)"
@@ -39,6 +482,7 @@ if __name__ == "__main__":
     parser.add_argument(
         "replace",
         type=str,
+        nargs="?",
         help=(
             "The replacement string. :<name> or :<Number> will insert the "
             "corresponding capture group content. Unnamed capture groups "
@@ -50,7 +494,10 @@ if __name__ == "__main__":
         "-n",
         "-nono",
         action="store_true",
-        help="No action: print names of files to be renamed, but don't rename.",
+        help=(
+            "No action: print the planned renames, including temporary names, "
+            "but don't rename."
+        ),
     )
     parser.add_argument(
         "-r",
@@ -58,37 +505,79 @@ if __name__ == "__main__":
         action="store_true",
         help="Recursively search for matching files.",
     )
+    parser.add_argument(
+        "-exclude",
+        type=str,
+        default=None,
+        help="A regex pattern. Directories whose name matches are not searched.",
+    )
+    parser.add_argument(
+        "-workers",
+        type=int,
+        default=None,
+        help="Number of threads used for renaming. Defaults to the Python default.",
+    )
+    parser.add_argument(
+        "-journal",
+        type=str,
+        default=None,
+        help=(
+            "(Optional) Write the plan and the progress to this new file, so "
+            "that an interrupted run can be resumed or undone."
+        ),
+    )
+    parser.add_argument(
+        "-resume",
+        type=str,
+        default=None,
+        help="Continue the renames recorded in this journal.",
+    )
+    parser.add_argument(
+        "-undo",
+        type=str,
+        default=None,
+        help="Revert the renames recorded in this journal.",
+    )
 
     args = parser.parse_args()
 
-    inpath = Path(args.inpath)
+    if args.undo is not None:
+        journal = Journal.load(args.undo)
+        errors = undo_renames(journal, args.workers)
+        journal.close()
+    elif args.resume is not None:
+        journal = Journal.load(args.resume)
+        errors = apply_renames(None, args.workers, journal=journal)
+        journal.close()
+    else:
+        if args.replace is None:
+            parser.error("inpath, pattern and replace are required")
 
-    search_pattern = re.compile(args.pattern)
+        search_pattern = re.compile(args.pattern)
+        exclude = re.compile(args.exclude) if args.exclude is not None else None
+
+        try:
+            ops = plan_renames(
+                scan(args.inpath, args.r, exclude), search_pattern, args.replace
+            )
+        except RenameError as exc:
+            parser.exit(1, f"Nothing renamed: {exc}\n")
+        phases = schedule_renames(ops)
 
-    matches = []
-    glob = "**/*" if args.r else "*"
-    for p in inpath.glob(glob):
-        match = search_pattern.search(str(p))
-        if match:
-            matches.append(match)
-
-    group_pattern = re.compile(":<(.*?)>")
-    groups_in_replace = group_pattern.findall(args.replace)
-
-    for match in matches:
-        path_str = match.group(0)
-        replace_str = args.replace
-        for group_name in groups_in_replace:
-            if group_name in match.groupdict():
-                replace_str = replace_str.replace(
-                    f":<{group_name}>", match.group(group_name)
-                )
-            elif int(group_name) <= len(match.groups()) + len(match.groupdict()):
-                replace_str = replace_str.replace(
-                    f":<{group_name}>", match.group(int(group_name))
-                )
-        path = match.string.replace(path_str, replace_str)
         if args.n:
-            print(f"Rename({match.string}, {path})")
-        else:
-            Path(match.string).rename(path)
+            for phase in phases:
+                for source, destination in phase:
+                    print(f"Rename({source}, {destination})")
+            parser.exit()
+
+        journal = None
+        if args.journal is not None:
+            journal = Journal.create(args.journal, phases)
+        errors = apply_renames(phases, args.workers, journal=journal)
+        if journal is not None:
+            journal.close()
+
+    for source, destination, exc in errors:
+        print(f"Failed Rename({source}, {destination}): {exc}")
+    if errors:
+        sys.exit(1)
@@ -0,0 +1,916 @@
+# Requires
+# Python 3.7+, cairo, cairosvg, Pillow (installed with cairosvg)
+#
+# Can be installed with:
+# conda install cairo
+# pip install cairosvg
+#
+# Description:
+# Batch convert SVG files to PNG files.
+# Can be used from the command line or imported:
+#   convert_tree()
+#   convert_tree_async()
+#   benchmark_dispatch()
+#   benchmark_compression()
+# Files are converted by one of three execution strategies:
+#   "process": A pool of consumer processes. Files are handed out in chunks
+#              whose size adapts to the observed conversion time per file.
+#              Crashed consumers are respawned. Fastest for large trees.
+#   "thread":  A thread pool. Cheap to start, useful for small trees.
+#   "asyncio": Conversions run in a thread pool driven by an asyncio event
+#              loop. `convert_tree_async()` can be awaited from a running loop.
+# An existing `concurrent.futures.Executor` can be passed as well.
+# Scanning streams files into the pool as they are found, so conversion starts
+# right away. Per-file timings, split into the read, decode, render and encode
+# stages, and errors are returned as `ConversionStats`.
+#
+# Example:
+# ```
+# python svg2png.py ./svgs ./pngs -executor process -compress_level 1
+# python svg2png.py ./svgs ./pngs -benchmark dispatch
+# python svg2png.py ./svgs ./pngs -benchmark compression
+# ```
+
+import argparse
+import asyncio
+import collections
+import concurrent.futures
+import contextlib
+import itertools
+import multiprocessing
+import multiprocessing.connection
+import os
+from pathlib import Path
+import queue
+import sys
+import threading
+import time
+from typing import Dict, List, NamedTuple, Optional
+import zlib
+
+from cairosvg.parser import Tree
+from cairosvg.surface import PNGSurface
+from PIL import Image
+
+try:
+    from instrumentation import count, observe
+except ImportError:
+    count = observe = lambda *args, **labels: contextlib.nullcontext()
+
+
+PNG_STRATEGIES = {
+    "default": zlib.Z_DEFAULT_STRATEGY,
+    "filtered": zlib.Z_FILTERED,
+    "huffman": zlib.Z_HUFFMAN_ONLY,
+    "rle": zlib.Z_RLE,
+    "fixed": zlib.Z_FIXED,
+}
+
+EXECUTORS = ("process", "thread", "asyncio")
+
+
+class FileStats(NamedTuple):
+    """Result of converting a single file.
+
+    `stages` maps "read", "decode", "render" and "encode" to the seconds spent
+    in each stage. Stages after an error are missing. It is `None` if the file
+    was never converted, e.g. because its consumer process died.
+    """
+
+    inpath: str
+    outpath: str
+    seconds: float
+    error: Optional[str] = None
+    stages: Optional[Dict[str, float]] = None
+
+
+class ConversionStats(NamedTuple):
+    """Result of `convert_tree()`."""
+
+    files: List[FileStats]
+    seconds: float
+
+    @property
+    def failures(self) -> List[FileStats]:
+        return [f for f in self.files if f.error is not None]
+
+    @property
+    def files_per_second(self) -> float:
+        return len(self.files) / self.seconds if self.seconds > 0 else 0.0
+
+
+def _record(stats):
+    """Records `stats` as metrics. Conversions run in other processes or
+    threads, so their timings are taken from the returned `FileStats`."""
+    for f in stats.files:
+        observe("svg2png", f.seconds, stage="convert")
+        for stage, seconds in (f.stages or {}).items():
+            observe("svg2png", seconds, stage=stage)
+    failed = len(stats.failures)
+    count("svg2png_files", len(stats.files) - failed, status="converted")
+    count("svg2png_files", failed, status="failed")
+    observe("svg2png", stats.seconds, stage="total")
+    return stats
+
+
+def render_svg(
+    svg,
+    outpath,
+    dpi=96,
+    scale=1,
+    output_width=None,
+    output_height=None,
+    compress_level=None,
+    png_strategy=None,
+):
+    """Renders the SVG document `svg` to the PNG file `outpath`.
+
+    Without `compress_level` and `png_strategy` the PNG is written by cairo.
+    Otherwise the rendered surface is encoded with Pillow, which exposes the
+    zlib settings. PNG compression is often the largest part of the conversion
+    time, so lower levels or the "rle" strategy can speed things up noticeably.
+
+    Args:
+        svg (bytes): Content of an SVG file.
+        outpath (str): Path of the PNG file to write.
+        dpi (float, optional): Ratio between 1 inch and 1 pixel. Defaults to 96.
+        scale (float, optional): Scaling factor of the output. Defaults to 1.
+        output_width (int, optional): Width of the output in pixels. Defaults
+            to the width of the SVG.
+        output_height (int, optional): Height of the output in pixels.
+            Defaults to the height of the SVG.
+        compress_level (int, optional): zlib compression level between 0 and 9.
+            Defaults to None.
+        png_strategy (str, optional): zlib strategy, one of `PNG_STRATEGIES`.
+            Defaults to None.
+
+    Returns:
+        Dict[str, float]: Seconds spent parsing ("decode"), rendering
+            ("render") and encoding and writing the PNG ("encode").
+    """
+    # Cairo writes the PNG itself when the surface is finished.
+    use_cairo = compress_level is None and png_strategy is None
+    stages = {}
+    start = time.perf_counter()
+    tree = Tree(bytestring=svg)
+    stages["decode"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    surface = PNGSurface(
+        tree,
+        outpath if use_cairo else None,
+        dpi,
+        scale=scale,
+        output_width=output_width,
+        output_height=output_height,
+    )
+    surface.cairo.flush()
+    stages["render"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    if use_cairo:
+        surface.finish()
+        stages["encode"] = time.perf_counter() - start
+        return stages
+
+    # Cairo stores premultiplied ARGB in native byte order.
+    image = Image.frombuffer(
+        "RGBA",
+        (surface.width, surface.height),
+        surface.cairo.get_data(),
+        "raw",
+        "BGRa" if sys.byteorder == "little" else "aRGB",
+        surface.cairo.get_stride(),
+        1,
+    )
+    image.save(
+        outpath,
+        format="PNG",
+        compress_level=-1 if compress_level is None else compress_level,
+        compress_type=PNG_STRATEGIES[png_strategy or "default"],
+    )
+    stages["encode"] = time.perf_counter() - start
+    return stages
+
+
+def convert_file(inpath, outpath, render_options=None):
+    """Converts a single file and measures the time it took.
+
+    Exceptions are not raised but returned as `FileStats.error`.
+
+    Args:
+        inpath (str): Path of the SVG file.
+        outpath (str): Path of the PNG file to write.
+        render_options (dict, optional): Keyword arguments for `render_svg()`.
+
+    Returns:
+        FileStats: Timings and error of the conversion.
+    """
+    start = time.perf_counter()
+    error = None
+    stages = {}
+    try:
+        with open(inpath, "rb") as f:
+            svg = f.read()
+        stages["read"] = time.perf_counter() - start
+        stages.update(render_svg(svg, outpath, **(render_options or {})))
+    except Exception as exc:
+        error = repr(exc)
+    return FileStats(inpath, outpath, time.perf_counter() - start, error, stages)
+
+
+def iter_svg_files(inpath, outpath, overwrite=False):
+    """Yields `(inpath, outpath)` tuples for all .svg files below `inpath`.
+
+    The directory structure below `inpath` is recreated at `outpath` while
+    scanning. Files whose output already exists are skipped unless `overwrite`
+    is set.
+
+    Args:
+        inpath (str or pathlib.Path): Root directory to search for .svg files.
+        outpath (str or pathlib.Path): Root directory of the converted files.
+        overwrite (bool, optional): Convert files whose output already exists.
+            Defaults to False.
+
+    Yields:
+        Tuple[str, str]: Path of an .svg file and of the .png file to write.
+    """
+    inpath = Path(inpath)
+    outpath = Path(outpath)
+    created_dirs = set()
+    # Only the time spent in here is recorded, not the time between items.
+    seconds = 0.0
+    start = time.perf_counter()
+    try:
+        for p in inpath.rglob("*.svg"):
+            if not p.is_file():
+                continue
+            relative = p.relative_to(inpath)
+            new_path = Path(str(outpath / relative.parent / relative.stem) + ".png")
+            if not overwrite and new_path.exists():
+                continue
+            if new_path.parent not in created_dirs:
+                new_path.parent.mkdir(parents=True, exist_ok=True)
+                created_dirs.add(new_path.parent)
+            seconds += time.perf_counter() - start
+            yield str(p), str(new_path)
+            start = time.perf_counter()
+        seconds += time.perf_counter() - start
+    finally:
+        observe("svg2png", seconds, stage="scan")
+
+
+class Consumer(multiprocessing.Process):
+    """Converts chunks of `(inpath, outpath)` tuples taken from `task_queue`.
+
+    Each item on `task_queue` is a tuple `(chunk_id, chunk)`. A `None` item
+    shuts the consumer down. After each chunk the tuple `(chunk_id, stats)` is
+    sent through `result_conn`, where `stats` is a list of `FileStats`.
+    Sending through a pipe is synchronous, so every reported chunk reaches the
+    parent even if the consumer crashes right afterwards.
+    """
+
+    def __init__(self, task_queue, result_conn, render_options):
+        super().__init__(daemon=True)
+        self.task_queue = task_queue
+        self.result_conn = result_conn
+        self.render_options = render_options
+
+    def run(self):
+        while True:
+            item = self.task_queue.get()
+            if item is None:
+                return
+            chunk_id, chunk = item
+            stats = [convert_file(i, o, self.render_options) for i, o in chunk]
+            self.result_conn.send((chunk_id, stats))
+
+
+def next_chunk_size(
+    n_pending, n_workers, seconds_per_file, chunk_seconds, min_chunk_size
+):
+    """Computes the size of the next chunk handed to a consumer.
+
+    Chunks are sized so that converting them takes about `chunk_seconds`, but
+    never exceed a fair share of the remaining files. Chunks therefore shrink
+    towards the end of the run, which keeps all consumers busy until the last
+    file is converted.
+
+    Args:
+        n_pending (int): Number of files that have not been handed out yet.
+        n_workers (int): Number of consumers.
+        seconds_per_file (float): Observed average conversion time per file or
+            `None` if nothing has been measured yet.
+        chunk_seconds (float): Targeted conversion time per chunk.
+        min_chunk_size (int): Lower bound for the chunk size.
+
+    Returns:
+        int: Number of files to put into the next chunk.
+    """
+    if seconds_per_file is None:
+        size = min_chunk_size
+    else:
+        size = int(chunk_seconds / max(seconds_per_file, 1e-6))
+    fair_share = -(-n_pending // (2 * n_workers))
+    return max(min_chunk_size, 1, min(size, fair_share))
+
+
+def _scan(files, put, errors):
+    """Calls `put` with all items of `files` and with `None` at the end."""
+    try:
+        for item in files:
+            put(item)
+    except Exception as exc:
+        errors.append(exc)
+    finally:
+        put(None)
+
+
+def _convert_process(
+    files, workers, render_options, chunk_seconds, min_chunk_size, report_interval
+):
+    """Converts `files` with a pool of `Consumer` processes."""
+    s_time = time.time()
+    scan_queue = queue.Queue()
+    scan_errors = []
+    scanner = threading.Thread(
+        target=_scan, args=(files, scan_queue.put, scan_errors), daemon=True
+    )
+    scanner.start()
+
+    def start_consumer():
+        task_queue = multiprocessing.Queue()
+        result_reader, result_writer = multiprocessing.Pipe(duplex=False)
+        consumer = Consumer(task_queue, result_writer, render_options)
+        consumer.start()
+        result_writer.close()
+        return consumer, task_queue, result_reader
+
+    # Every consumer has its own task queue and result pipe, so the chunks a
+    # consumer was working on are known when it crashes. Chunks are processed
+    # in order, hence the oldest unreported chunk is the one that crashed it.
+    consumers, task_queues, result_readers = map(
+        list, zip(*(start_consumer() for _ in range(workers)))
+    )
+
+    pending = collections.deque()
+    # Files of crashed chunks. Each one is retried once in a chunk of its own.
+    retries = collections.deque()
+    chunks = {}
+    assigned = [collections.deque() for _ in range(workers)]
+    next_chunk_id = 0
+    scanning = True
+    n_found = 0
+    results = []
+    seconds_per_file = None
+    last_report = time.time()
+    while True:
+        while scanning:
+            try:
+                item = scan_queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                scanning = False
+            else:
+                pending.append(item)
+                n_found += 1
+
+        # Keep at most two chunks per consumer in flight, so that chunk sizes
+        # can follow the observed conversion latency.
+        for worker_id in range(workers):
+            while len(assigned[worker_id]) < 2 and (retries or pending):
+                if retries:
+                    chunk = [retries.popleft()]
+                    retried = True
+                else:
+                    size = next_chunk_size(
+                        len(pending),
+                        workers,
+                        seconds_per_file,
+                        chunk_seconds,
+                        min_chunk_size,
+                    )
+                    chunk = [pending.popleft() for _ in range(min(size, len(pending)))]
+                    retried = False
+                chunks[next_chunk_id] = (chunk, retried)
+                assigned[worker_id].append(next_chunk_id)
+                task_queues[worker_id].put((next_chunk_id, chunk))
+                next_chunk_id += 1
+
+        if not scanning and not chunks:
+            break
+
+        multiprocessing.connection.wait(
+            result_readers + [w.sentinel for w in consumers],
+            timeout=0.05 if scanning else 1.0,
+        )
+
+        for worker_id, w in enumerate(consumers):
+            reader = result_readers[worker_id]
+            try:
+                while reader.poll():
+                    chunk_id, stats = reader.recv()
+                    chunks.pop(chunk_id)
+                    assigned[worker_id].popleft()
+                    results.extend(stats)
+                    latency = sum(s.seconds for s in stats) / len(stats)
+                    if seconds_per_file is None:
+                        seconds_per_file = latency
+                    else:
+                        seconds_per_file = 0.8 * seconds_per_file + 0.2 * latency
+            except EOFError:
+                pass
+
+            if w.is_alive():
+                continue
+            if assigned[worker_id]:
+                chunk, retried = chunks.pop(assigned[worker_id].popleft())
+                if retried:
+                    results.extend(
+                        FileStats(i, o, 0.0, f"Consumer died with exit code {w.exitcode}")
+                        for i, o in chunk
+                    )
+                else:
+                    retries.extend(chunk)
+            # Chunks queued behind the crashed one were never started.
+            for chunk_id in reversed(assigned[worker_id]):
+                chunk, retried = chunks.pop(chunk_id)
+                (retries if retried else pending).extendleft(reversed(chunk))
+            assigned[worker_id].clear()
+            reader.close()
+            # The requeued chunks may still sit in the feeder pipe of the old
+            # queue. Nobody reads it anymore, so its feeder thread must not be
+            # joined at exit.
+            task_queues[worker_id].cancel_join_thread()
+            task_queues[worker_id].close()
+            (
+                consumers[worker_id],
+                task_queues[worker_id],
+                result_readers[worker_id],
+            ) = start_consumer()
+
+        if report_interval is not None and time.time() - last_report >= report_interval:
+            last_report = time.time()
+            rate = len(results) / (last_report - s_time)
+            print(
+                f"{len(results)}/{n_found}{'+' if scanning else ''} files "
+                f"({rate:.1f} files/s)"
+            )
+
+    for task_queue in task_queues:
+        task_queue.put(None)
+    for w in consumers:
+        w.join()
+    for task_queue in task_queues:
+        task_queue.close()
+
+    if scan_errors:
+        raise scan_errors[0]
+    return results
+
+
+def _convert_executor(files, executor, render_options):
+    """Converts `files` by mapping `convert_file()` over `executor`."""
+    futures = [executor.submit(convert_file, i, o, render_options) for i, o in files]
+    return [f.result() for f in futures]
+
+
+async def convert_tree_async(
+    inpath, outpath, workers=None, render_options=None, overwrite=False
+):
+    """Converts all .svg files below `inpath` from within an asyncio loop.
+
+    The tree is scanned in a background thread, so the event loop is never
+    blocked by file system calls. Conversions run in a thread pool of `workers`
+    threads and at most `workers` conversions are scheduled at once, so
+    scanning and converting overlap.
+
+    Args:
+        inpath (str or pathlib.Path): Root directory to search for .svg files.
+        outpath (str or pathlib.Path): Root directory of the converted files.
+        workers (int, optional): Number of threads. Defaults to the CPU count.
+        render_options (dict, optional): Keyword arguments for `render_svg()`.
+        overwrite (bool, optional): Convert files whose output already exists.
+            Defaults to False.
+
+    Returns:
+        ConversionStats: Per-file timings and errors.
+    """
+    s_time = time.perf_counter()
+    workers = workers or os.cpu_count()
+    loop = asyncio.get_running_loop()
+    semaphore = asyncio.Semaphore(workers)
+    scan_queue = asyncio.Queue()
+    scan_errors = []
+    stopped = threading.Event()
+
+    def put(item):
+        try:
+            loop.call_soon_threadsafe(scan_queue.put_nowait, item)
+        except RuntimeError:
+            # The loop was closed, e.g. after this coroutine was cancelled.
+            pass
+
+    files = itertools.takewhile(
+        lambda _: not stopped.is_set(), iter_svg_files(inpath, outpath, overwrite)
+    )
+    threading.Thread(
+        target=_scan, args=(files, put, scan_errors), daemon=True
+    ).start()
+
+    async def convert(pool, i, o):
+        try:
+            return await loop.run_in_executor(pool, convert_file, i, o, render_options)
+        finally:
+            semaphore.release()
+
+    try:
+        with concurrent.futures.ThreadPoolExecutor(workers) as pool:
+            tasks = []
+            while True:
+                item = await scan_queue.get()
+                if item is None:
+                    break
+                await semaphore.acquire()
+                tasks.append(asyncio.ensure_future(convert(pool, *item)))
+            files = await asyncio.gather(*tasks)
+    finally:
+        # Stops the scan early if the conversion failed or was cancelled.
+        stopped.set()
+
+    if scan_errors:
+        raise scan_errors[0]
+    return _record(ConversionStats(list(files), time.perf_counter() - s_time))
+
+
+def convert_tree(
+    inpath,
+    outpath,
+    executor="process",
+    workers=None,
+    render_options=None,
+    overwrite=False,
+    chunk_seconds=0.5,
+    min_chunk_size=1,
+    report_interval=None,
+):
+    """Converts all .svg files below `inpath` to .png files below `outpath`.
+
+    Args:
+        inpath (str or pathlib.Path): Root directory to search for .svg files.
+        outpath (str or pathlib.Path): Root directory of the converted files.
+            The directory structure below `inpath` is recreated.
+        executor (str or concurrent.futures.Executor, optional): One of
+            `EXECUTORS` or an existing executor that is used as is. Defaults
+            to "process".
+        workers (int, optional): Number of processes or threads. Defaults to
+            the CPU count. Ignored if `executor` is an `Executor`.
+        render_options (dict, optional): Keyword arguments for `render_svg()`.
+        overwrite (bool, optional): Convert files whose output already exists.
+            Defaults to False.
+        chunk_seconds (float, optional): Targeted processing time of a chunk of
+            files. Only used by the "process" executor. Defaults to 0.5.
+        min_chunk_size (int, optional): Minimal number of files per chunk. Only
+            used by the "process" executor. Defaults to 1.
+        report_interval (float, optional): Seconds between progress reports
+            printed by the "process" executor. Defaults to no reports.
+
+    Returns:
+        ConversionStats: Per-file timings and errors.
+    """
+    if executor == "asyncio":
+        return asyncio.run(
+            convert_tree_async(inpath, outpath, workers, render_options, overwrite)
+        )
+
+    s_time = time.perf_counter()
+    workers = workers or os.cpu_count()
+    files = iter_svg_files(inpath, outpath, overwrite)
+    if isinstance(executor, concurrent.futures.Executor):
+        results = _convert_executor(files, executor, render_options)
+    elif executor == "thread":
+        with concurrent.futures.ThreadPoolExecutor(workers) as pool:
+            results = _convert_executor(files, pool, render_options)
+    elif executor == "process":
+        results = _convert_process(
+            files,
+            workers,
+            render_options,
+            chunk_seconds,
+            min_chunk_size,
+            report_interval,
+        )
+    else:
+        raise ValueError(f"Unknown executor {executor!r}, expected one of {EXECUTORS}")
+    return _record(ConversionStats(results, time.perf_counter() - s_time))
+
+
+# Compression settings compared by `benchmark_compression()` as
+# `(compress_level, png_strategy)`. `(None, None)` is the cairo PNG writer.
+COMPRESSION_SETTINGS = tuple(
+    [(None, None)]
+    + [(level, None) for level in (0, 1, 6, 9)]
+    + [(6, strategy) for strategy in PNG_STRATEGIES if strategy != "default"]
+)
+
+
+def _convert_chunk(chunk, render_options):
+    return [convert_file(i, o, render_options) for i, o in chunk]
+
+
+def _convert_static(files, workers, render_options):
+    """Converts `files` in one chunk per process after scanning all of them,
+    like the first version of this script. Only used as a baseline."""
+    files = list(files)
+    size = max(-(-len(files) // workers), 1)
+    with concurrent.futures.ProcessPoolExecutor(workers) as pool:
+        futures = [
+            pool.submit(_convert_chunk, files[i : i + size], render_options)
+            for i in range(0, len(files), size)
+        ]
+        return [stats for f in futures for stats in f.result()]
+
+
+def benchmark_dispatch(
+    inpath, outpath, workers=None, render_options=None, chunk_seconds=0.5
+):
+    """Converts all .svg files below `inpath` once per way of handing files to
+    the consumer processes and returns the stats of each run.
+
+    "static" scans the whole tree and then converts one chunk per process.
+    "per-item" hands out single files. "adaptive" sizes chunks by the observed
+    conversion time, which is what `convert_tree()` does by default.
+    Existing .png files are overwritten.
+
+    Args:
+        inpath (str or pathlib.Path): Root directory to search for .svg files.
+        outpath (str or pathlib.Path): Root directory of the converted files.
+        workers (int, optional): Number of processes. Defaults to the CPU count.
+        render_options (dict, optional): Keyword arguments for `render_svg()`.
+        chunk_seconds (float, optional): Targeted processing time of a chunk of
+            the "adaptive" run. Defaults to 0.5.
+
+    Returns:
+        Dict[str, ConversionStats]: Stats per dispatch strategy.
+    """
+    workers = workers or os.cpu_count()
+    s_time = time.perf_counter()
+    files = iter_svg_files(inpath, outpath, overwrite=True)
+    results = _convert_static(files, workers, render_options)
+    runs = {
+        "static": _record(ConversionStats(results, time.perf_counter() - s_time))
+    }
+    for name, seconds in (("per-item", 0), ("adaptive", chunk_seconds)):
+        runs[name] = convert_tree(
+            inpath,
+            outpath,
+            workers=workers,
+            render_options=render_options,
+            overwrite=True,
+            chunk_seconds=seconds,
+        )
+    return runs
+
+
+def benchmark_compression(
+    inpath, outpath, settings=COMPRESSION_SETTINGS, executor="process", **kwargs
+):
+    """Converts all .svg files below `inpath` once per compression setting and
+    returns the stats and the total size of the written files of each run.
+
+    Existing .png files are overwritten.
+
+    Args:
+        inpath (str or pathlib.Path): Root directory to search for .svg files.
+        outpath (str or pathlib.Path): Root directory of the converted files.
+        settings (Iterable[Tuple[int, str]], optional): Pairs of
+            `(compress_level, png_strategy)`. Defaults to
+            `COMPRESSION_SETTINGS`.
+        executor (str, optional): One of `EXECUTORS`. Defaults to "process".
+        **kwargs: Further keyword arguments for `convert_tree()`, e.g.
+            `workers` or `render_options`.
+
+    Returns:
+        Dict[Tuple[int, str], Tuple[ConversionStats, int]]: Stats and size in
+            bytes per setting.
+    """
+    render_options = kwargs.pop("render_options", None) or {}
+    runs = {}
+    for compress_level, png_strategy in settings:
+        stats = convert_tree(
+            inpath,
+            outpath,
+            executor=executor,
+            render_options=dict(
+                render_options,
+                compress_level=compress_level,
+                png_strategy=png_strategy,
+            ),
+            overwrite=True,
+            **kwargs,
+        )
+        size = sum(os.path.getsize(f.outpath) for f in stats.files if f.error is None)
+        runs[compress_level, png_strategy] = (stats, size)
+    return runs
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=(
+            "Scans recursively for .svg files and converts them to "
+            ".png files. Will use all available CPU cores to process "
+            "files in parallel."
+        )
+    )
+    parser.add_argument(
+        "inpath",
+        type=str,
+        help=(
+            "Root directory containing .svg files to be converted. This will"
+            " recursively search for .svg files starting at `inpath`."
+        ),
+    )
+    parser.add_argument(
+        "outpath",
+        type=str,
+        help=(
+            "Root directory where converted .svg files will be written to. "
+            "This will recreate the directory structure of files found at "
+            "`inpath`."
+        ),
+    )
+    parser.add_argument(
+        "-executor",
+        type=str,
+        default="process",
+        choices=EXECUTORS,
+        help="Execution strategy. Default is process.",
+    )
+    parser.add_argument(
+        "-workers",
+        type=int,
+        default=None,
+        help="Number of processes or threads. Defaults to the CPU count.",
+    )
+    parser.add_argument(
+        "-overwrite",
+        action="store_true",
+        help="Convert files whose .png file already exists.",
+    )
+    parser.add_argument(
+        "-chunk_seconds",
+        type=float,
+        default=0.5,
+        help="Targeted processing time of a single chunk of files. Default is 0.5.",
+    )
+    parser.add_argument(
+        "-min_chunk_size",
+        type=int,
+        default=1,
+        help="Minimal number of files per chunk. Default is 1.",
+    )
+    parser.add_argument(
+        "-report_interval",
+        type=float,
+        default=5.0,
+        help="Seconds between progress reports. Default is 5.",
+    )
+    parser.add_argument(
+        "-dpi",
+        type=float,
+        default=96,
+        help="Ratio between 1 inch and 1 pixel. Default is 96.",
+    )
+    parser.add_argument(
+        "-scale",
+        type=float,
+        default=1,
+        help="Scaling factor of the output. Default is 1.",
+    )
+    parser.add_argument(
+        "-width",
+        type=int,
+        default=None,
+        help="(Optional) Width of the output in pixels.",
+    )
+    parser.add_argument(
+        "-height",
+        type=int,
+        default=None,
+        help="(Optional) Height of the output in pixels.",
+    )
+    parser.add_argument(
+        "-compress_level",
+        type=int,
+        default=None,
+        choices=range(10),
+        help=(
+            "(Optional) zlib compression level of the PNG files. 0 is fastest, "
+            "9 is smallest. Defaults to the cairo PNG writer."
+        ),
+    )
+    parser.add_argument(
+        "-png_strategy",
+        type=str,
+        default=None,
+        choices=list(PNG_STRATEGIES),
+        help=(
+            "(Optional) zlib strategy used for the PNG files. \"rle\" is "
+            "usually the fastest. Defaults to the cairo PNG writer."
+        ),
+    )
+    parser.add_argument(
+        "-failure_report",
+        type=str,
+        default=None,
+        help=(
+            "(Optional) File that receives one line `<inpath>\\t<error>` per "
+            "file that could not be converted."
+        ),
+    )
+    parser.add_argument(
+        "-benchmark",
+        type=str,
+        default=None,
+        choices=["dispatch", "compression"],
+        help=(
+            "(Optional) Convert the tree once per dispatch strategy of the "
+            "process executor or once per compression setting and print the "
+            "throughput of each run. Overwrites existing .png files."
+        ),
+    )
+
+    args = parser.parse_args()
+
+    print(f"Reading files from {args.inpath} and writing to {args.outpath}")
+
+    render_options = dict(
+        dpi=args.dpi,
+        scale=args.scale,
+        output_width=args.width,
+        output_height=args.height,
+        compress_level=args.compress_level,
+        png_strategy=args.png_strategy,
+    )
+
+    if args.benchmark == "dispatch":
+        runs = benchmark_dispatch(
+            args.inpath,
+            args.outpath,
+            workers=args.workers,
+            render_options=render_options,
+            chunk_seconds=args.chunk_seconds,
+        )
+        for name, stats in runs.items():
+            print(
+                f"{name:>8}: {len(stats.files)} files in {stats.seconds:.2f}s "
+                f"({stats.files_per_second:.1f} files/s, "
+                f"{len(stats.failures)} failed)"
+            )
+        sys.exit(0)
+
+    if args.benchmark == "compression":
+        runs = benchmark_compression(
+            args.inpath,
+            args.outpath,
+            executor=args.executor,
+            workers=args.workers,
+            render_options=render_options,
+        )
+        for (compress_level, png_strategy), (stats, size) in runs.items():
+            print(
+                f"compress_level={compress_level}, png_strategy={png_strategy}: "
+                f"{stats.files_per_second:.1f} files/s, "
+                f"{size / 1024 ** 2:.1f} MiB, {len(stats.failures)} failed"
+            )
+        sys.exit(0)
+
+    stats = convert_tree(
+        args.inpath,
+        args.outpath,
+        executor=args.executor,
+        workers=args.workers,
+        render_options=render_options,
+        overwrite=args.overwrite,
+        chunk_seconds=args.chunk_seconds,
+        min_chunk_size=args.min_chunk_size,
+        report_interval=args.report_interval,
+    )
+
+    print(
+        f"Finished {len(stats.files)} in {stats.seconds:.2f}s "
+        f"({stats.files_per_second:.1f} files/s, executor={args.executor}, "
+        f"compress_level={args.compress_level}, png_strategy={args.png_strategy})"
+    )
+
+    failures = stats.failures
+    if failures:
+        print(f"Failed to convert {len(failures)} files:")
+        for f in failures:
+            print(f"  {f.inpath}: {f.error}")
+        if args.failure_report is not None:
+            with open(args.failure_report, "w") as report:
+                for f in failures:
+                    report.write(f"{f.inpath}\t{f.error}\n")
+        sys.exit(1)
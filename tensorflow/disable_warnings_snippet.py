@@ -1,10 +1,19 @@
 # Description:
 # This disables everything except error messages displayed when using tensorflow.
 # Code has to be added before anything else to work.
+#
+# Tensorflow is not imported here. Its Python loggers are configured by name, so
+# the snippet costs nothing when the code path never uses tensorflow.
+# In interactive sessions, e.g. Jupyter or `python -i`, tensorflow sets its
+# logger back to INFO on first use. The filters still drop everything below
+# ERROR, as they are not reset by tensorflow.
 
 import warnings
 warnings.filterwarnings('ignore')
 import os
 os.environ["TF_CPP_MIN_LOG_LEVEL"] = "2"
-from tensorflow.python.platform import tf_logging as logging
-logging.set_verbosity(logging.ERROR)
\ No newline at end of file
+import logging
+for _name in ("tensorflow", "absl"):
+    logging.getLogger(_name).setLevel(logging.ERROR)
+    logging.getLogger(_name).addFilter(lambda record: record.levelno >= logging.ERROR)
+del _name
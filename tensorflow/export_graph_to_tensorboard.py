@@ -1,27 +1,225 @@
 # Requires
-# Python, Tensorflow (2.0+)
+# Python 3.7+, Tensorflow (2.5+)
 #
 # Can be installed with:
 # pip install tensorflow
 #
 # Description:
-# Reads a protobuf file and exports the graph to `output_directory` so it can
-# be visualized in tensorboard.
+# Reads protobuf files and exports their graphs to `output_directory` so they
+# can be visualized in tensorboard.
+#   load_graph_def()
+#   strip_constants()
+#   export_graph()
+#   export_graphs()
+# Files are read with `tf.io.gfile`, so paths like gs:// work as well. The
+# GraphDef is written as is, without importing it into a `tf.Graph` first,
+# which would hold a second copy of every constant. With `-strip_constants`
+# the values of large constants are removed so only the topology (and the
+# dtype and shape of every constant) is written.
+# Several files are exported in parallel worker processes, each into a
+# subdirectory of `output_directory` named after the file. Tensorflow is then
+# only imported by the workers. A single file is exported in the calling
+# process, which imports Tensorflow.
+#
+# Example:
+# ```
+# python export_graph_to_tensorboard.py model_a.pb model_b.pb -output_directory logs -strip_constants
+# tensorboard --logdir logs
+# ```
+
+import concurrent.futures
+import multiprocessing
+import os
+import time
+from typing import NamedTuple, Optional
+
+
+class ExportResult(NamedTuple):
+    """Result of exporting a single protobuf file."""
 
-import tensorflow as tf
-from tensorflow.core.framework import graph_pb2
-from tensorflow.python.summary import summary
+    pb_file: str
+    logdir: str
+    nodes: int = 0
+    stripped_bytes: int = 0
+    seconds: float = 0.0
+    error: Optional[str] = None
 
-output_directory = ''
-graph_def_pb_file = "<file>.pb"
 
-with tf.io.gfile.GFile(graph_def_pb_file, "rb") as f:
+def load_graph_def(pb_file):
+    """Parses a GraphDef from `pb_file`.
+
+    The file is read into memory as a whole. Parsing from a memory map would
+    not save that copy: the default (upb) protobuf backend only accepts
+    `bytes` and copies a `memoryview` into `bytes` first.
+    """
+    import tensorflow as tf
+    from tensorflow.core.framework import graph_pb2
+
     graph_def = graph_pb2.GraphDef()
-    graph_def.ParseFromString(f.read())
+    with tf.io.gfile.GFile(pb_file, "rb") as f:
+        graph_def.ParseFromString(f.read())
+    return graph_def
+
+
+def _strip_nodes(nodes, max_bytes):
+    stripped = 0
+    for node in nodes:
+        if node.op != "Const" or "value" not in node.attr:
+            continue
+        tensor = node.attr["value"].tensor
+        size = tensor.ByteSize()
+        if size <= max_bytes:
+            continue
+        for field, _ in tensor.ListFields():
+            if field.name not in ("dtype", "tensor_shape"):
+                tensor.ClearField(field.name)
+        stripped += size - tensor.ByteSize()
+    return stripped
+
+
+def strip_constants(graph_def, max_bytes=1024):
+    """Removes the values of constants larger than `max_bytes` in place.
+
+    The dtype and shape of every constant are kept, so tensorboard still shows
+    them. Also strips constants inside of the function library.
+
+    Returns:
+        int: Number of bytes removed.
+    """
+    stripped = _strip_nodes(graph_def.node, max_bytes)
+    for function in graph_def.library.function:
+        stripped += _strip_nodes(function.node_def, max_bytes)
+    return stripped
+
+
+def export_graph(pb_file, output_directory, strip=False, max_const_bytes=1024):
+    """Exports the graph in `pb_file` as a tensorboard summary to `output_directory`.
+
+    Args:
+        pb_file (str): Path to a serialized GraphDef.
+        output_directory (str): Directory the event file is written to.
+        strip (bool, optional): Whether to strip constants larger than
+            `max_const_bytes` before export. Defaults to False.
+        max_const_bytes (int, optional): See `strip_constants()`. Defaults to 1024.
+
+    Returns:
+        ExportResult: Number of nodes, stripped bytes and time taken.
+    """
+    import tensorflow as tf
+
+    start = time.perf_counter()
+    graph_def = load_graph_def(pb_file)
+    stripped = strip_constants(graph_def, max_const_bytes) if strip else 0
+
+    writer = tf.summary.create_file_writer(output_directory)
+    with writer.as_default():
+        tf.summary.graph(graph_def)
+    writer.close()
+
+    return ExportResult(
+        pb_file,
+        output_directory,
+        len(graph_def.node),
+        stripped,
+        time.perf_counter() - start,
+    )
+
+
+def _export(pb_file, logdir, strip, max_const_bytes):
+    try:
+        return export_graph(pb_file, logdir, strip, max_const_bytes)
+    except Exception as exc:
+        return ExportResult(pb_file, logdir, error=repr(exc))
+
+
+def export_graphs(
+    pb_files, output_directory, workers=None, strip=False, max_const_bytes=1024
+):
+    """Exports many protobuf files in parallel worker processes.
+
+    Every graph is written to `output_directory/<file name without extension>`.
+    With a single file or worker, the files are exported in the calling
+    process instead, which then imports Tensorflow.
+
+    Args:
+        pb_files (List[str]): Paths to serialized GraphDefs.
+        output_directory (str): Parent directory of the per-file log directories.
+        workers (int, optional): Number of worker processes. Defaults to the
+            CPU count, but at most the number of files.
+        strip (bool, optional): See `export_graph()`. Defaults to False.
+        max_const_bytes (int, optional): See `strip_constants()`. Defaults to 1024.
+
+    Returns:
+        List[ExportResult]: One result per file, in the order of `pb_files`.
+    """
+    logdirs = [
+        os.path.join(output_directory, os.path.splitext(os.path.basename(f))[0])
+        for f in pb_files
+    ]
+    if len(set(logdirs)) != len(logdirs):
+        raise ValueError("Files with the same name would share a log directory")
+
+    workers = min(workers or os.cpu_count(), len(pb_files))
+    if workers <= 1:
+        return [
+            _export(f, d, strip, max_const_bytes) for f, d in zip(pb_files, logdirs)
+        ]
+    # Forking a process that already initialized Tensorflow can deadlock.
+    with concurrent.futures.ProcessPoolExecutor(
+        workers, mp_context=multiprocessing.get_context("spawn")
+    ) as executor:
+        futures = [
+            executor.submit(_export, f, d, strip, max_const_bytes)
+            for f, d in zip(pb_files, logdirs)
+        ]
+        return [f.result() for f in futures]
+
 
+if __name__ == "__main__":
+    import argparse
+    import sys
 
-with tf.Graph().as_default() as graph:
-    tf.import_graph_def(graph_def, name="")
+    parser = argparse.ArgumentParser(
+        description="Exports GraphDef protobuf files for visualization in tensorboard."
+    )
+    parser.add_argument("pb_files", nargs="+", help="GraphDef protobuf files.")
+    parser.add_argument(
+        "-output_directory",
+        default="logs",
+        help="Directory the graphs are written to, one subdirectory per file. Default is logs.",
+    )
+    parser.add_argument(
+        "-strip_constants",
+        action="store_true",
+        help="Remove the values of large constants and only export the topology.",
+    )
+    parser.add_argument(
+        "-max_const_bytes",
+        type=int,
+        default=1024,
+        help="Constants larger than this are stripped. Default is 1024.",
+    )
+    parser.add_argument(
+        "-workers",
+        type=int,
+        default=None,
+        help="Number of worker processes. Defaults to the CPU count.",
+    )
+    args = parser.parse_args()
 
-    pb_visual_writer = summary.FileWriter(output_directory)
-    pb_visual_writer.add_graph(graph)
+    results = export_graphs(
+        args.pb_files,
+        args.output_directory,
+        args.workers,
+        args.strip_constants,
+        args.max_const_bytes,
+    )
+    for r in results:
+        if r.error is not None:
+            print(f"{r.pb_file}: failed: {r.error}")
+        else:
+            print(
+                f"{r.pb_file}: {r.nodes} nodes, stripped {r.stripped_bytes} bytes, "
+                f"{r.seconds:.2f}s -> {r.logdir}"
+            )
+    sys.exit(1 if any(r.error is not None for r in results) else 0)